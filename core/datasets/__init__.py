@@ -1,7 +1,11 @@
 from .gamepals_dataset import GamePalsDataset
 from .gamepals_dataset_transformer import GamePalsDatasetTransformer
+from .gamepals_dataset_pipeline import GamePalsDatasetPipeline
+from .columnar_batch import ColumnarBatch
 
 __all__ = [
     'GamePalsDatasetTransformer',
+    'GamePalsDatasetPipeline',
     'GamePalsDataset',
+    'ColumnarBatch',
 ]
\ No newline at end of file
@@ -0,0 +1,433 @@
+import dataclasses
+import json
+import os
+from enum import Enum
+from functools import lru_cache
+from operator import attrgetter
+from typing import TypeVar, Generic, Iterable, Iterator, Type, get_origin, get_args, get_type_hints
+
+import numpy as np
+from pydantic import BaseModel, TypeAdapter
+
+T = TypeVar('T')
+
+OFFSETS_SUFFIX = '#offsets'
+META_FILENAME = 'meta.json'
+ITER_CHUNK_SIZE = 4096
+
+_SCALAR_DTYPES = {
+    bool: np.bool_,
+    int: np.int64,
+    float: np.float64,
+}
+
+
+class ColumnSpec:
+    """
+    The description of a single column of a ColumnarBatch
+
+    :ivar str name: the dotted path of the field, relative to the root model (e.g. 'MONSTERS.distance')
+    :ivar str attr: the dotted path of the field, relative to the items of its group
+    :ivar str | None group: the name of the ragged list the column belongs to, None for root-level fields
+    :ivar str kind: one of 'bool', 'int', 'float', 'enum' or 'str'
+    :ivar Type[Enum] | None enum: the enum class, for 'enum' columns
+    :ivar type dtype: the NumPy type of the column
+    """
+
+    def __init__(self, name: str, attr: str, group: str | None, annotation: Type, dtype: str | None = None):
+        self.name = name
+        self.attr = attr
+        self.group = group
+        self.enum = None
+        if isinstance(annotation, type) and issubclass(annotation, Enum):
+            self.kind = 'enum'
+            self.enum = annotation
+            self.dtype = np.int16
+        elif annotation is str:
+            self.kind = 'str'
+            self.dtype = np.int32
+        elif annotation in _SCALAR_DTYPES:
+            self.kind = annotation.__name__
+            self.dtype = np.dtype(dtype).type if dtype is not None else _SCALAR_DTYPES[annotation]
+        else:
+            raise TypeError(f"Unsupported field type for column {name}: {annotation}")
+
+
+def _is_record(annotation: Type) -> bool:
+    return isinstance(annotation, type) and (issubclass(annotation, BaseModel) or dataclasses.is_dataclass(annotation))
+
+
+def _fields_of(cls: Type) -> list[tuple[str, Type, str | None]]:
+    # The name, type and (optional) NumPy dtype of each field of a pydantic model or dataclass
+    if dataclasses.is_dataclass(cls):
+        hints = get_type_hints(cls)
+        return [(field.name, hints[field.name], field.metadata.get('dtype')) for field in dataclasses.fields(cls)]
+    return [(name, field.annotation, None) for name, field in cls.model_fields.items()]
+
+
+class ColumnarSchema:
+    """
+    The flattening of a pydantic model (or dataclass) into columns.
+    Nested models are flattened into dotted column names, while lists of models become ragged groups:
+    their fields are stored in columns of their own, and the group is indexed by an offsets column
+    (row i owns items offsets[i]:offsets[i+1]).
+    Scalar dataclass fields may narrow their NumPy type through their metadata (e.g. field(metadata={'dtype': 'float32'})).
+
+    :ivar list[ColumnSpec] columns: the scalar columns
+    :ivar list[str] groups: the names of the ragged groups
+    :ivar dict template: the nested description of the model, used to rebuild items
+    """
+
+    def __init__(self, cls: Type[BaseModel]):
+        self.columns: list[ColumnSpec] = list()
+        self.groups: list[str] = list()
+        self.template = self._walk(cls, prefix='', group=None, group_prefix='')
+        self.specs = {spec.name: spec for spec in self.columns}
+
+    def group_of(self, name: str) -> str | None:
+        """
+        Finds the ragged group a column is indexed by
+
+        :param name: the name of the column (either a field or the offsets of a group)
+        :return: the name of the group, None for root-level columns
+        """
+        if name.endswith(OFFSETS_SUFFIX):
+            return None
+        return self.specs[name].group
+
+    def _walk(self, cls: Type, prefix: str, group: str | None, group_prefix: str) -> dict:
+        template = dict()
+        for name, annotation, dtype in _fields_of(cls):
+            path = f"{prefix}{name}"
+            if _is_record(annotation):
+                template[name] = ('model', self._walk(annotation, f"{path}.", group, f"{group_prefix}{name}."))
+            elif get_origin(annotation) is list:
+                item_cls = get_args(annotation)[0]
+                if group is not None or not _is_record(item_cls):
+                    raise TypeError(f"Unsupported list field {path}: only root-level lists of models can be stored")
+                self.groups.append(path)
+                template[name] = ('list', path, self._walk(item_cls, f"{path}.", path, ''))
+            else:
+                spec = ColumnSpec(path, f"{group_prefix}{name}", group, annotation, dtype)
+                self.columns.append(spec)
+                template[name] = ('column', spec.name)
+        return template
+
+
+@lru_cache(maxsize=None)
+def schema_of(cls: Type[BaseModel]) -> ColumnarSchema:
+    return ColumnarSchema(cls)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(cls: Type) -> TypeAdapter:
+    return TypeAdapter(list[cls])
+
+
+class ColumnarBatch(Generic[T]):
+    """
+    ColumnarBatch is a struct-of-arrays representation of a dataset of pydantic models (or dataclasses).
+    Every scalar field is stored as a NumPy column: enums as integer codes into the enum members,
+    strings as integer codes into a vocabulary, and lists of sub-models as ragged groups with CSR-style offsets.
+
+    :ivar Type cls: the class of the items in the batch
+    :ivar dict[str, np.ndarray] columns: the columns, including the offsets of each ragged group
+    :ivar dict[str, list[str]] vocabs: the vocabulary of each string column
+    """
+
+    def __init__(self, cls: Type[T], columns: dict[str, np.ndarray], vocabs: dict[str, list[str]] | None = None):
+        """
+        Creates a ColumnarBatch
+
+        :param cls: the class of the items in the batch
+        :param columns: the columns of the batch, including the offsets of each ragged group
+        :param vocabs: the vocabulary of each string column
+        """
+        self.cls = cls
+        self.schema = schema_of(cls)
+        self.columns = columns
+        self.vocabs = vocabs if vocabs else dict()
+        self.length = 0
+        for name, column in columns.items():
+            if name.endswith(OFFSETS_SUFFIX):
+                self.length = len(column) - 1
+                break
+            if self.schema.group_of(name) is None:
+                self.length = len(column)
+                break
+
+    @classmethod
+    def from_items(cls, items: Iterable[T], item_cls: Type[T]) -> "ColumnarBatch[T]":
+        """
+        Builds a ColumnarBatch from a collection of items
+
+        :param items: the items
+        :param item_cls: the class of the items
+        :return: the columnar batch
+        """
+        schema = schema_of(item_cls)
+        items = list(items)
+
+        group_items = {None: items}
+        columns = dict()
+        for group in schema.groups:
+            getter = attrgetter(group)
+            lists = [getter(item) for item in items]
+            offsets = np.zeros(len(items) + 1, dtype=np.int64)
+            np.cumsum(np.fromiter(map(len, lists), dtype=np.int64, count=len(items)), out=offsets[1:])
+            columns[f"{group}{OFFSETS_SUFFIX}"] = offsets
+            group_items[group] = [sub for sublist in lists for sub in sublist]
+
+        vocabs = dict()
+        for spec in schema.columns:
+            values = map(attrgetter(spec.attr), group_items[spec.group])
+            count = len(group_items[spec.group])
+            if spec.kind == 'enum':
+                codes = {member: code for code, member in enumerate(spec.enum)}
+                values = (codes[v] for v in values)
+            elif spec.kind == 'str':
+                vocab = dict()
+                values = [vocab.setdefault(v, len(vocab)) for v in values]
+                vocabs[spec.name] = list(vocab)
+            columns[spec.name] = np.fromiter(values, dtype=spec.dtype, count=count)
+
+        return cls(item_cls, columns, vocabs)
+
+    @classmethod
+    def concat(cls, batches: list["ColumnarBatch[T]"]) -> "ColumnarBatch[T]":
+        """
+        Concatenates batches of the same class of items, merging the vocabularies of their string columns
+
+        :param batches: the batches, with the same columns
+        :return: the columnar batch with the rows of every batch, in order
+        """
+        item_cls = batches[0].cls
+        schema = schema_of(item_cls)
+        columns = dict()
+        for group in schema.groups:
+            name = f"{group}{OFFSETS_SUFFIX}"
+            if name in batches[0].columns:
+                starts = np.cumsum([0] + [batch.columns[name][-1] for batch in batches[:-1]])
+                columns[name] = np.concatenate(
+                    [batches[0].columns[name][:1]] + [batch.columns[name][1:] + start for batch, start in zip(batches, starts)]
+                )
+
+        vocabs = dict()
+        for spec in schema.columns:
+            if spec.name not in batches[0].columns:
+                continue
+            if spec.kind != 'str':
+                columns[spec.name] = np.concatenate([batch.columns[spec.name] for batch in batches])
+                continue
+            vocab = dict()
+            codes = list()
+            for batch in batches:
+                remap = np.array([vocab.setdefault(v, len(vocab)) for v in batch.vocabs[spec.name]], dtype=spec.dtype)
+                codes.append(remap[batch.columns[spec.name]] if len(remap) > 0 else batch.columns[spec.name])
+            columns[spec.name] = np.concatenate(codes).astype(spec.dtype, copy=False)
+            vocabs[spec.name] = list(vocab)
+
+        return cls(item_cls, columns, vocabs)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def offsets(self, group: str) -> np.ndarray:
+        """
+        Returns the CSR-style offsets of a ragged group
+
+        :param group: the name of the group (e.g. 'MONSTERS')
+        :return: the offsets array, of length len(self) + 1
+        """
+        return self.columns[f"{group}{OFFSETS_SUFFIX}"]
+
+    def decode(self, name: str) -> np.ndarray:
+        """
+        Decodes an enum or string column into an object array of its values
+
+        :param name: the name of the column
+        :return: the decoded values
+        """
+        spec = self.schema.specs[name]
+        if spec.kind == 'enum':
+            return np.array(list(spec.enum), dtype=object)[self.columns[name]]
+        if spec.kind == 'str':
+            return np.array(self.vocabs[name], dtype=object)[self.columns[name]]
+        return self.columns[name]
+
+    def take(self, indices: np.ndarray | Iterable[int]) -> "ColumnarBatch[T]":
+        """
+        Selects a subset of the rows of the batch, with their ragged groups
+
+        :param indices: the indices of the selected rows, in the desired order
+        :return: the new columnar batch
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = dict()
+        sub_indices = dict()
+        for group in self.schema.groups:
+            name = f"{group}{OFFSETS_SUFFIX}"
+            if name not in self.columns:
+                continue
+            offsets = self.columns[name]
+            lengths = offsets[indices + 1] - offsets[indices]
+            new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=new_offsets[1:])
+            columns[name] = new_offsets
+            sub_indices[group] = np.repeat(offsets[indices] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+
+        for spec in self.schema.columns:
+            if spec.name in self.columns:
+                rows = indices if spec.group is None else sub_indices[spec.group]
+                columns[spec.name] = np.asarray(self.columns[spec.name][rows])
+
+        return type(self)(self.cls, columns, self.vocabs)
+
+    def with_columns(self, columns: dict[str, np.ndarray]) -> "ColumnarBatch[T]":
+        """
+        Replaces some of the columns of the batch, sharing all the others
+
+        :param columns: the new columns, by name
+        :return: the new columnar batch
+        """
+        return type(self)(self.cls, {**self.columns, **columns}, self.vocabs)
+
+    def filter_group(self, group: str, keep: np.ndarray) -> "ColumnarBatch[T]":
+        """
+        Drops some of the items of a ragged group, sharing all the columns outside the group
+
+        :param group: the name of the group (e.g. 'MONSTERS')
+        :param keep: a boolean mask over the items of the group
+        :return: the new columnar batch
+        """
+        owners = np.repeat(np.arange(len(self)), np.diff(self.offsets(group)))
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners[keep], minlength=len(self)), out=offsets[1:])
+
+        columns = {f"{group}{OFFSETS_SUFFIX}": offsets}
+        for spec in self.schema.columns:
+            if spec.group == group and spec.name in self.columns:
+                columns[spec.name] = self.columns[spec.name][keep]
+        return self.with_columns(columns)
+
+    def to_items(self) -> list[T]:
+        """
+        Rebuilds the items of the batch
+
+        :return: the list of items
+        """
+        missing = [spec.name for spec in self.schema.columns if spec.name not in self.columns]
+        if missing:
+            raise ValueError(f"Cannot rebuild {self.cls.__name__} items from a projected batch (missing {missing})")
+
+        values = dict()
+        for spec in self.schema.columns:
+            if spec.kind in ('enum', 'str'):
+                values[spec.name] = self.decode(spec.name).tolist()
+            else:
+                values[spec.name] = self.columns[spec.name].tolist()
+
+        def build(template: dict) -> list[dict]:
+            # Builds the dicts of a whole level at once, column by column
+            fields = list()
+            for kind, *rest in template.values():
+                if kind == 'column':
+                    fields.append(values[rest[0]])
+                elif kind == 'model':
+                    fields.append(build(rest[0]))
+                else:
+                    group, sub_template = rest
+                    sub_items = build(sub_template)
+                    offsets = self.offsets(group).tolist()
+                    fields.append([sub_items[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)])
+            return [dict(zip(template, row)) for row in zip(*fields)]
+
+        return _list_adapter(self.cls).validate_python(build(self.schema.template))
+
+    def __iter__(self) -> Iterator[T]:
+        # Rebuild items a chunk at a time, so that iterating never materializes the whole batch
+        for start in range(0, len(self), ITER_CHUNK_SIZE):
+            yield from self.take(np.arange(start, min(start + ITER_CHUNK_SIZE, len(self)))).to_items()
+
+    def __getitem__(self, index: int | slice) -> T | list[T]:
+        if isinstance(index, slice):
+            return self.take(np.arange(len(self))[index]).to_items()
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.take([index]).to_items()[0]
+
+    def apply(self, transform: "GamePalsDatasetTransformer") -> "ColumnarBatch[T]":
+        return transform.transform(self)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the batch into a directory, with one .npy file per column
+
+        :param path: the path of the directory
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, column in self.columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(column))
+        with open(os.path.join(path, META_FILENAME), 'w') as f:
+            json.dump(
+                {
+                    'length': len(self),
+                    'columns': list(self.columns),
+                    'vocabs': self.vocabs,
+                    'enums': {
+                        spec.name: [member.value for member in spec.enum]
+                        for spec in self.schema.columns
+                        if spec.kind == 'enum' and spec.name in self.columns
+                    },
+                },
+                f,
+                indent=4
+            )
+
+    @classmethod
+    def load(
+            cls,
+            path: str,
+            item_cls: Type[T],
+            fields: Iterable[str] | None = None,
+            mmap_mode: str | None = 'r'
+    ) -> "ColumnarBatch[T]":
+        """
+        Loads a batch saved with ColumnarBatch.save
+
+        :param path: the path of the directory
+        :param item_cls: the class of the items in the batch
+        :param fields: the fields to load (e.g. 'MONSTERS' or 'AIMED_AT.interactable'), None to load all of them
+        :param mmap_mode: the memory-map mode of the columns (see numpy.load), None to read them in memory
+        :return: the columnar batch
+        """
+        with open(os.path.join(path, META_FILENAME), 'r') as f:
+            meta = json.load(f)
+
+        names = meta['columns']
+        if fields is not None:
+            fields = list(fields)
+            names = [
+                name for name in names
+                if any(name == field or name.startswith(f"{field}.") or name.startswith(f"{field}#") for field in fields)
+            ]
+            # Ragged columns are useless without the offsets of their group
+            groups = {schema_of(item_cls).group_of(name) for name in names} - {None}
+            names += [f"{group}{OFFSETS_SUFFIX}" for group in groups if f"{group}{OFFSETS_SUFFIX}" not in names]
+
+        columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in names
+        }
+
+        # Remap enum codes if the enum members changed since the batch was saved
+        schema = schema_of(item_cls)
+        for spec in schema.columns:
+            saved = meta['enums'].get(spec.name)
+            if spec.name in columns and saved is not None and saved != [member.value for member in spec.enum]:
+                remap = np.array([list(spec.enum).index(spec.enum(value)) for value in saved], dtype=spec.dtype)
+                columns[spec.name] = remap[columns[spec.name]]
+
+        return cls(item_cls, columns, meta['vocabs'])
@@ -0,0 +1,136 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import TypeVar, Generic, Iterator, Type
+
+from pydantic import TypeAdapter
+
+T = TypeVar('T')
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(cls: Type) -> TypeAdapter:
+    return TypeAdapter(list[cls])
+
+
+def _line_aligned_ranges(path: str, chunk_size: int) -> list[tuple[int, int]]:
+    """
+    Splits a file into byte ranges of roughly chunk_size bytes, each starting at the beginning of a line
+
+    :param path: the path of the file
+    :param chunk_size: the approximate size of each range, in bytes
+    :return: the list of (start, end) byte ranges
+    """
+    size = os.path.getsize(path)
+    ranges = list()
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_range(path: str, start: int, end: int, cls: Type, prefix: bytes, batch_size: int) -> list:
+    """
+    Parses the items logged in a line-aligned byte range of a file
+
+    :param path: the path of the file
+    :param start: the first byte of the range (inclusive)
+    :param end: the last byte of the range (exclusive)
+    :param cls: the class of the logged items
+    :param prefix: the prefix marking the lines that contain an item
+    :param batch_size: how many lines to validate at once
+    :return: the list of parsed items, in file order
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+
+    payloads = [
+        line[len(prefix):].strip()
+        for line in chunk.split(b'\n')
+        if line.startswith(prefix)
+    ]
+
+    adapter = _list_adapter(cls)
+    items = list()
+    for i in range(0, len(payloads), batch_size):
+        items.extend(adapter.validate_json(b'[' + b','.join(payloads[i:i + batch_size]) + b']'))
+    return items
+
+
+class GameLogReader(Generic[T]):
+    """
+    A lazy source of items parsed from gameplay log files.
+    Files are read in bounded, line-aligned chunks and the logged lines are validated in batches,
+    so that items can be consumed while the logs are still being parsed.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            cls: Type[T],
+            prefix: str = "[GS] GAMESTATE ",
+            chunk_size: int = 8 * 1024 * 1024,
+            batch_size: int = 1024,
+            n_workers: int = 1,
+    ):
+        """
+        Creates a GameLogReader
+
+        :param path: a gamelog file, or a directory containing gamelog files
+        :param cls: the pydantic class of the logged items
+        :param prefix: the prefix marking the lines that contain an item
+        :param chunk_size: the approximate number of bytes read at once from a file
+        :param batch_size: how many lines to validate at once
+        :param n_workers: the number of processes parsing chunks in parallel (1 parses in the current process)
+        """
+        self.path = path
+        self.cls = cls
+        self.prefix = prefix.encode('utf-8')
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.n_workers = n_workers
+
+    def files(self) -> list[str]:
+        """
+        Lists the gamelog files to read, in a deterministic order
+
+        :return: the list of file paths
+        """
+        if os.path.isfile(self.path):
+            return [self.path]
+        return sorted(entry.path for entry in os.scandir(self.path) if entry.is_file())
+
+    def chunks(self) -> Iterator[tuple[str, int, int]]:
+        """
+        Lists the line-aligned chunks of all the gamelog files
+
+        :return: an iterator of (path, start, end) byte ranges
+        """
+        for path in self.files():
+            for start, end in _line_aligned_ranges(path, self.chunk_size):
+                yield path, start, end
+
+    def __iter__(self) -> Iterator[T]:
+        if self.n_workers <= 1:
+            for path, start, end in self.chunks():
+                yield from _parse_range(path, start, end, self.cls, self.prefix, self.batch_size)
+            return
+
+        # Keep a bounded window of chunks in flight, yielding them in file order
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            pending = deque()
+            for path, start, end in self.chunks():
+                pending.append(executor.submit(
+                    _parse_range, path, start, end, self.cls, self.prefix, self.batch_size
+                ))
+                if len(pending) >= 2 * self.n_workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
@@ -1,6 +1,9 @@
 from typing import TypeVar, Generic, Iterable, Type
 import json
 
+from core.datasets.columnar_batch import ColumnarBatch
+from core.datasets.gamelog_reader import GameLogReader
+
 T = TypeVar('T')
 
 
@@ -24,10 +27,31 @@ class GamePalsDataset(Generic[T]):
     def append(self, item: T) -> None:
         self.items.append(item)
 
+    def take(self, indices: Iterable[int]) -> "GamePalsDataset[T]":
+        """
+        Selects a subset of the items of the dataset
+
+        :param indices: the indices of the selected items, in the desired order
+        :return: the new gamepals dataset
+        """
+        return GamePalsDataset(self.items[i] for i in indices)
+
     def apply(self, transform: "GamePalsDatasetTransformer") -> "GamePalsDataset":
         return transform.transform(self)
 
     def save(self, path: str):
+        """
+        Saves the dataset. Paths ending in .json are exported as JSON,
+        any other path is a directory in the columnar format of ColumnarBatch.
+
+        :param path: the path of the file or directory
+        """
+        if not path.endswith('.json'):
+            if not self.items:
+                raise ValueError("Cannot save an empty dataset in the columnar format")
+            ColumnarBatch.from_items(self.items, type(self.items[0])).save(path)
+            return
+
         with open(path, 'w') as f:
             json.dump(
                 [item.model_dump() for item in self.items],
@@ -37,9 +61,32 @@ class GamePalsDataset(Generic[T]):
 
     @staticmethod
     def load(path: str, cls: Type) -> "GamePalsDataset":
+        """
+        Loads a dataset saved with GamePalsDataset.save
+
+        :param path: the path of the file or directory
+        :param cls: the class of the items in the dataset
+        :return: the loaded gamepals dataset
+        """
+        if not path.endswith('.json'):
+            return GamePalsDataset(ColumnarBatch.load(path, cls).to_items())
+
         with open(path, 'r') as f:
             items = json.load(f)
             x = GamePalsDataset()
             for item in items:
                 x.append(cls(**item))
-            return x
\ No newline at end of file
+            return x
+
+    @staticmethod
+    def from_gamelogs(path: str, cls: Type[T], **options) -> GameLogReader[T]:
+        """
+        Streams the items logged in gameplay log files.
+        Items are parsed lazily, chunk by chunk, so they can be consumed before parsing finishes.
+
+        :param path: a gamelog file, or a directory containing gamelog files
+        :param cls: the pydantic class of the logged items
+        :param options: the options of the GameLogReader (prefix, chunk_size, batch_size, n_workers)
+        :return: a lazy iterable of the logged items
+        """
+        return GameLogReader(path, cls, **options)
@@ -0,0 +1,47 @@
+from typing import TypeVar, Generic, Iterable, Iterator
+
+from core.datasets.gamepals_dataset import GamePalsDataset
+from core.datasets.gamepals_dataset_transformer import GamePalsDatasetTransformer
+
+T = TypeVar('T')
+
+
+class GamePalsDatasetPipeline(Generic[T]):
+    """
+    GamePalsDatasetPipeline is a lazy chain of GamePalsDatasetTransformers.
+    Items flow through all the transformers in a single pass: streaming transformers handle one item
+    at a time, so only barrier transformers (e.g. clusterers) ever hold a full dataset in memory.
+    """
+
+    def __init__(self, source: Iterable[T], transformers: list[GamePalsDatasetTransformer] | None = None):
+        """
+        Creates a GamePalsDatasetPipeline
+
+        :param source: the iterable of items entering the pipeline (e.g. a dataset or a gamelog reader)
+        :param transformers: the transformers to apply, in order
+        """
+        self.source = source
+        self.transformers = list(transformers) if transformers else list()
+
+    def apply(self, transform: GamePalsDatasetTransformer) -> "GamePalsDatasetPipeline":
+        """
+        Appends a transformer to the pipeline, without running it
+
+        :param transform: the transformer to append
+        :return: the new pipeline
+        """
+        return GamePalsDatasetPipeline(self.source, self.transformers + [transform])
+
+    def __iter__(self) -> Iterator:
+        items = iter(self.source)
+        for transformer in self.transformers:
+            items = transformer.stream(items)
+        return items
+
+    def collect(self) -> GamePalsDataset:
+        """
+        Runs the pipeline and materializes its output
+
+        :return: the resulting gamepals dataset
+        """
+        return GamePalsDataset(self)
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
 
 from core.datasets import GamePalsDataset
 
@@ -9,3 +10,13 @@ class GamePalsDatasetTransformer(ABC):
     def transform(self, x: GamePalsDataset) -> GamePalsDataset:
         pass
 
+    def stream(self, items: Iterable) -> Iterator:
+        """
+        Lazily transforms a stream of items.
+        By default, the transformer is a barrier: the whole stream is materialized before being transformed.
+        Transformers that can work one item at a time should override this method.
+
+        :param items: the stream of items to transform
+        :return: the stream of transformed items
+        """
+        yield from self.transform(GamePalsDataset(items))
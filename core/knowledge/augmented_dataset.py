@@ -0,0 +1,92 @@
+from typing import TypeVar, Generic, Iterable, Iterator
+import numpy as np
+
+from core.datasets import GamePalsDataset
+
+T = TypeVar('T')
+
+
+class AugmentedDataset(Generic[T]):
+    """
+    A virtual view of the perturbations of a dataset.
+    Perturbations are never stored: item i is regenerated on demand, from the random stream
+    of the base item it was derived from, so the view behaves like the materialized output of
+    DatasetPerturbator.transform while using the memory of the base dataset only.
+    """
+
+    def __init__(self, base: GamePalsDataset[T], perturbator: "DatasetPerturbator"):
+        """
+        Creates an AugmentedDataset
+
+        :param base: the dataset of the items to perturbate
+        :param perturbator: the perturbator producing the perturbations (with a fixed seed)
+        """
+        self.base = base
+        self.perturbator = perturbator
+
+        if perturbator.count_perturbations is not None:
+            counts = [perturbator.count_perturbations(item) for item in base]
+        else:
+            counts = [len(perturbator.perturbations_of(item, index)) for index, item in enumerate(base)]
+        counts = np.asarray(counts, dtype=np.int64)
+
+        # When every item has k perturbations, item i is perturbation i mod k of base item i // k
+        self.k = int(counts[0]) if len(counts) > 0 and np.all(counts == counts[0]) else None
+        self.offsets = None if self.k is not None else np.concatenate([[0], np.cumsum(counts)])
+        self.length = len(counts) * self.k if self.k is not None else int(self.offsets[-1])
+
+        self._cached_index = None
+        self._cached_perturbations = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def locate(self, index: int) -> tuple[int, int]:
+        """
+        Finds where an item of the view comes from
+
+        :param index: the index of the item in the view
+        :return: the index of its base item, and the index of the perturbation among the ones of the base item
+        """
+        if self.k is not None:
+            return divmod(index, self.k)
+        base_index = int(np.searchsorted(self.offsets, index, side='right')) - 1
+        return base_index, index - int(self.offsets[base_index])
+
+    def perturbations_of(self, base_index: int) -> list[T]:
+        """
+        Regenerates all the perturbations of a base item, remembering the last one for sequential access
+
+        :param base_index: the index of the base item
+        :return: the perturbations of the base item
+        """
+        if self._cached_index != base_index:
+            self._cached_perturbations = self.perturbator.perturbations_of(self.base[base_index], base_index)
+            self._cached_index = base_index
+        return self._cached_perturbations
+
+    def __getitem__(self, index: int | slice) -> T | list[T]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        base_index, perturbation_index = self.locate(index)
+        return self.perturbations_of(base_index)[perturbation_index]
+
+    def __iter__(self) -> Iterator[T]:
+        for base_index, item in enumerate(self.base):
+            yield from self.perturbator.perturbations_of(item, base_index)
+
+    def take(self, indices: Iterable[int]) -> GamePalsDataset[T]:
+        """
+        Materializes a subset of the view
+
+        :param indices: the indices of the selected items, in the desired order
+        :return: the new gamepals dataset
+        """
+        return GamePalsDataset(self[i] for i in indices)
+
+    def apply(self, transform: "GamePalsDatasetTransformer") -> GamePalsDataset:
+        return transform.transform(self)
@@ -0,0 +1,86 @@
+import dataclasses
+import hashlib
+import json
+import os
+
+from core.knowledge.batch_scheduler import BatchShard
+
+
+class BatchManifest:
+    """
+    The on-disk record of a job made of many OpenAI batches.
+    For each shard it stores the item indices, the hash of the request file, the uploaded file id,
+    the batch id, the status and the output file, so that a job whose process died can be resumed
+    (re-attaching to the running batches) instead of being submitted, and paid for, again.
+    The manifest is rewritten atomically, so it is never left half-written.
+    It also stores the fingerprint of the requests of the job, so that a manifest left by a job with
+    other requests (e.g. another dataset or prompt) is not resumed.
+
+    :ivar str path: the path of the JSON manifest
+    :ivar list[BatchShard] shards: the shards of the job
+    :ivar str | None fingerprint: the fingerprint of the requests of the job, None if unknown
+    """
+
+    def __init__(self, path: str):
+        """
+        Creates a BatchManifest, loading the shards of an existing manifest at the given path
+
+        :param path: the path of the JSON manifest
+        """
+        self.path = path
+        self.shards: list[BatchShard] = list()
+        self.fingerprint: str | None = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.shards = [BatchShard(**shard) for shard in manifest["shards"]]
+            self.fingerprint = manifest.get("fingerprint")
+
+    def save(self) -> None:
+        """
+        Writes the manifest to disk
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"fingerprint": self.fingerprint, "shards": [dataclasses.asdict(shard) for shard in self.shards]},
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+
+    def retries_of(self, shard: BatchShard) -> list[BatchShard]:
+        """
+        Finds the shards retrying the failed requests of a shard
+
+        :param shard: the shard
+        :return: the shards whose retry_of is the input path of the shard
+        """
+        return [other for other in self.shards if other.retry_of == shard.input_path]
+
+    def changed_shards(self) -> list[BatchShard]:
+        """
+        Finds the submitted shards whose request file no longer matches the one they were submitted with
+
+        :return: the shards with a batch whose request file exists and has another hash
+        """
+        return [
+            shard for shard in self.shards
+            if shard.batch_id is not None and shard.input_hash is not None and os.path.exists(shard.input_path)
+            and self.hash_file(shard.input_path) != shard.input_hash
+        ]
+
+    @staticmethod
+    def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+        """
+        Computes the content hash of a file
+
+        :param path: the path of the file
+        :param chunk_size: the number of bytes read at once
+        :return: the hex digest of the content of the file
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+        return digest.hexdigest()
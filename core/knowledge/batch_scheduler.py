@@ -0,0 +1,185 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
+
+@dataclass
+class BatchShard:
+    """
+    A request file to run as a single OpenAI batch
+
+    :ivar str input_path: the path of the JSONL request file
+    :ivar int n_tokens: the (estimated) number of tokens the batch enqueues
+    :ivar list[int] item_indices: the indices of the items (e.g. game states) the requests are built from
+    :ivar str | None input_hash: the hash of the request file, once written
+    :ivar str | None file_id: the id of the uploaded request file, once submitted
+    :ivar str | None batch_id: the id of the batch, once submitted
+    :ivar str status: the last known status of the batch ("pending" before submission, "cached" if never submitted
+        because its outputs are already known)
+    :ivar int n_failed: the number of requests of the batch that failed
+    :ivar str | None output_file_id: the id of the output file of the batch, once ended
+    :ivar str | None error_file_id: the id of the error file of the batch, once ended (if any request failed)
+    :ivar str | None retry_of: the input path of the shard whose failed requests this shard retries
+    """
+    input_path: str
+    n_tokens: int
+    item_indices: list[int] = field(default_factory=list)
+    input_hash: str | None = None
+    file_id: str | None = None
+    batch_id: str | None = None
+    status: str = "pending"
+    n_failed: int = 0
+    output_file_id: str | None = None
+    error_file_id: str | None = None
+    retry_of: str | None = None
+
+
+class BatchScheduler:
+    """
+    Runs many OpenAI batches concurrently, keeping as many of them in flight
+    as an enqueued-token budget allows: the next shard is submitted as soon as
+    a running batch ends and frees enough of the budget.
+    All in-flight batches are polled by a single loop, whose interval grows while
+    nothing changes and resets as soon as any batch makes progress.
+    """
+
+    def __init__(
+            self,
+            client: Any,
+            max_enqueued_tokens: int,
+            endpoint: str = "/v1/responses",
+            min_poll_interval: float = 5.0,
+            max_poll_interval: float = 60.0,
+            backoff_factor: float = 1.5,
+            sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Creates a BatchScheduler
+
+        :param client: the OpenAI client (or any object exposing the same files and batches APIs)
+        :param max_enqueued_tokens: the maximum number of tokens enqueued at once by the in-flight batches
+        :param endpoint: the endpoint the batches are run against
+        :param min_poll_interval: the polling interval (in seconds) after a batch made progress
+        :param max_poll_interval: the maximum polling interval (in seconds)
+        :param backoff_factor: the growth of the polling interval while no batch makes progress
+        :param sleep: the function used to wait between polls
+        """
+        self.client = client
+        self.max_enqueued_tokens = max_enqueued_tokens
+        self.endpoint = endpoint
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff_factor = backoff_factor
+        self.sleep = sleep
+
+    @staticmethod
+    def pack(n_tokens: list[int], max_tokens: int) -> list[range]:
+        """
+        Greedily packs consecutive requests into shards of at most max_tokens tokens
+        (a single request larger than max_tokens gets a shard of its own)
+
+        :param n_tokens: the number of tokens of each request
+        :param max_tokens: the maximum number of tokens of a shard
+        :return: the range of request positions of each shard
+        """
+        shards = list()
+        start, total = 0, 0
+        for i, tokens in enumerate(n_tokens):
+            if i > start and total + tokens > max_tokens:
+                shards.append(range(start, i))
+                start, total = i, 0
+            total += tokens
+        if start < len(n_tokens):
+            shards.append(range(start, len(n_tokens)))
+        return shards
+
+    def submit(self, shard: BatchShard) -> None:
+        """
+        Uploads the request file of a shard and creates its batch
+
+        :param shard: the shard to submit
+        """
+        with open(shard.input_path, "rb") as f:
+            uploaded_file = self.client.files.create(file=f, purpose="batch")
+
+        batch = self.client.batches.create(
+            input_file_id=uploaded_file.id,
+            endpoint=self.endpoint,
+            completion_window="24h"
+        )
+        shard.file_id = uploaded_file.id
+        shard.batch_id = batch.id
+        shard.status = batch.status
+
+    def run(
+            self,
+            shards: list[BatchShard],
+            on_end: Callable[[BatchShard, Any], None] | None = None,
+            on_change: Callable[[BatchShard], None] | None = None,
+    ) -> list[BatchShard]:
+        """
+        Runs shards until all their batches end. Shards are submitted in order;
+        a shard larger than the whole budget is only submitted when no other batch is in flight.
+        Shards that already have a batch id are re-attached: they are polled without being submitted again,
+        and only the shards with a "pending" status are submitted.
+
+        :param shards: the shards to run
+        :param on_end: the (optional) function called with each shard and its final batch object, as soon as it ends
+        :param on_change: the (optional) function called with each shard whenever it is submitted or its status changes
+        :return: the shards, with their batch ids and final statuses
+        """
+        pending = [shard for shard in shards if shard.batch_id is None and shard.status == "pending"]
+        in_flight = [shard for shard in shards if shard.batch_id is not None and shard.status not in TERMINAL_STATUSES]
+        enqueued_tokens = sum(shard.n_tokens for shard in in_flight)
+        progress = dict()
+        poll_interval = self.min_poll_interval
+
+        while pending or in_flight:
+            while pending and (not in_flight or enqueued_tokens + pending[0].n_tokens <= self.max_enqueued_tokens):
+                shard = pending.pop(0)
+                self.submit(shard)
+                in_flight.append(shard)
+                enqueued_tokens += shard.n_tokens
+                print(f"[Batch {shard.batch_id}] submitted {shard.input_path} "
+                      f"({enqueued_tokens}/{self.max_enqueued_tokens} tokens enqueued)")
+                if on_change is not None:
+                    on_change(shard)
+
+            changed = False
+            for shard in list(in_flight):
+                batch = self.client.batches.retrieve(shard.batch_id)
+                counts = batch.request_counts
+                state = (batch.status, counts.completed, counts.failed) if counts is not None else (batch.status,)
+                shard_changed = progress.get(shard.batch_id) != state
+                if shard_changed:
+                    progress[shard.batch_id] = state
+                    changed = True
+                    if counts is not None:
+                        print(f"[Batch {shard.batch_id}] status = {batch.status} - "
+                              f"progress = {counts.completed}/{counts.total} (failed = {counts.failed})")
+                shard.status = batch.status
+
+                if batch.status in TERMINAL_STATUSES:
+                    in_flight.remove(shard)
+                    enqueued_tokens -= shard.n_tokens
+                    shard.n_failed = counts.failed if counts is not None else 0
+                    shard.output_file_id = batch.output_file_id
+                    shard.error_file_id = batch.error_file_id
+                    if on_end is not None:
+                        on_end(shard, batch)
+                if shard_changed and on_change is not None:
+                    on_change(shard)
+
+            if changed:
+                poll_interval = self.min_poll_interval
+            else:
+                poll_interval = min(poll_interval * self.backoff_factor, self.max_poll_interval)
+
+            # When an ended batch freed enough of the budget, the next shard is submitted right away
+            if not in_flight or pending and enqueued_tokens + pending[0].n_tokens <= self.max_enqueued_tokens:
+                continue
+            self.sleep(poll_interval)
+
+        return shards
@@ -0,0 +1,114 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+_CUSTOM_ID_PLACEHOLDER = "\x00custom_id\x00"
+_USER_CONTENT_PLACEHOLDER = "\x00user_content\x00"
+
+
+class BatchRequestWriter:
+    """
+    Writes the JSONL request files of the OpenAI Batch API.
+    The request envelope (endpoint, model, parameters and system prompt) is the same for every request,
+    so it is serialized once: each line only splices in the JSON encoding of its custom_id and user content,
+    producing exactly the same bytes as json.dumps of the whole request.
+
+    :ivar str envelope: the serialized request, with placeholders for its custom_id and user content
+    """
+
+    def __init__(
+            self,
+            model: str,
+            system_prompt: str,
+            max_output_tokens: int = 256,
+            temperature: float = 1.0,
+            url: str = "/v1/responses",
+    ):
+        """
+        Creates a BatchRequestWriter
+
+        :param model: the model the requests are sent to
+        :param system_prompt: the system prompt shared by every request
+        :param max_output_tokens: the maximum number of output tokens of each request
+        :param temperature: the sampling temperature of each request
+        :param url: the endpoint of the requests
+        """
+        request = {
+            "custom_id": _CUSTOM_ID_PLACEHOLDER,
+            "method": "POST",
+            "url": url,
+            "body": {
+                "model": model,
+                "max_output_tokens": max_output_tokens,
+                "temperature": temperature,  # TODO: verify if ignored or used
+                "input": [
+                    {
+                        "role": "system",
+                        "content": system_prompt
+                    },
+                    {
+                        "role": "user",
+                        "content": _USER_CONTENT_PLACEHOLDER
+                    }
+                ]
+            }
+        }
+        encoded = json.dumps(request)
+        self.envelope = encoded
+        self.prefix, rest = encoded.split(json.dumps(_CUSTOM_ID_PLACEHOLDER))
+        self.middle, self.suffix = rest.split(json.dumps(_USER_CONTENT_PLACEHOLDER))
+        self.suffix += "\n"
+
+    def line(self, custom_id: str, user_content: str) -> str:
+        """
+        Serializes a single request
+
+        :param custom_id: the id of the request
+        :param user_content: the user message of the request
+        :return: the JSONL line of the request, including its newline
+        """
+        return f"{self.prefix}{json.dumps(custom_id)}{self.middle}{json.dumps(user_content)}{self.suffix}"
+
+    def write_shards(
+            self,
+            shards: Iterable[tuple[str, list[int]]],
+            render: Callable[[list[int]], list[str]],
+            custom_id: Callable[[int], str],
+            chunk_size: int = 10_000,
+    ) -> None:
+        """
+        Writes many request files in a single streaming pass.
+        Items are rendered a chunk at a time, and the next chunk is rendered in the background
+        while the current one is written, so memory does not grow with the number of requests.
+
+        :param shards: the (path, item indices) of each file to write
+        :param render: the function that renders the user content of a list of item indices
+        :param custom_id: the function that gives the custom_id of an item index
+        :param chunk_size: the number of items rendered at once
+        """
+        # (path, indices, whether the chunk starts a new file) of each chunk
+        chunks = [
+            (path, indices[start:start + chunk_size], start == 0)
+            for path, indices in shards
+            for start in range(0, max(len(indices), 1), chunk_size)
+        ]
+        if not chunks:
+            return
+
+        f = None
+        try:
+            with ThreadPoolExecutor(1) as executor:
+                rendering = executor.submit(render, chunks[0][1])
+                for i, (path, chunk, starts_file) in enumerate(chunks):
+                    texts = rendering.result()
+                    if i + 1 < len(chunks):
+                        rendering = executor.submit(render, chunks[i + 1][1])
+
+                    if starts_file:
+                        if f is not None:
+                            f.close()
+                        f = open(path, "w", encoding="utf-8")
+                    f.write("".join(self.line(custom_id(idx), text) for idx, text in zip(chunk, texts)))
+        finally:
+            if f is not None:
+                f.close()
@@ -0,0 +1,110 @@
+import os
+from dataclasses import dataclass
+from typing import Type
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from core.datasets import GamePalsDataset
+
+
+class ClusterIndex:
+    """
+    The persistent state of a DatasetClusterer: the unique feature rows clustered so far,
+    the cluster each of them belongs to, and the representative item of each cluster.
+    Noise rows (label -1) are not indexed.
+
+    :ivar np.ndarray features: the unique feature rows
+    :ivar np.ndarray labels: the cluster label of each feature row
+    :ivar np.ndarray counts: how many items shared each feature row
+    :ivar GamePalsDataset representatives: the representative item of each cluster, indexed by cluster label
+    """
+
+    def __init__(
+            self,
+            features: np.ndarray,
+            labels: np.ndarray,
+            counts: np.ndarray,
+            representatives: GamePalsDataset,
+    ):
+        """
+        Creates a ClusterIndex
+
+        :param features: the unique feature rows
+        :param labels: the cluster label of each feature row, in [0, len(representatives))
+        :param counts: how many items shared each feature row
+        :param representatives: the representative item of each cluster, indexed by cluster label
+        """
+        self.features = features
+        self.labels = labels
+        self.counts = counts
+        self.representatives = representatives
+
+    def __len__(self) -> int:
+        return len(self.representatives)
+
+    def assign(self, features: np.ndarray, eps: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Assigns feature rows to the cluster of their nearest indexed row, if it is within eps
+
+        :param features: the feature rows to assign
+        :param eps: the maximum distance from an indexed row
+        :return: the cluster label of each row (-1 if too far from every indexed row),
+            and the position of the nearest indexed row
+        """
+        if len(self.features) == 0:
+            return np.full(len(features), -1), np.full(len(features), -1)
+
+        neighbours = NearestNeighbors(n_neighbors=1).fit(self.features)
+        distances, nearest = neighbours.kneighbors(features)
+        distances, nearest = distances[:, 0], nearest[:, 0]
+        return np.where(distances <= eps, self.labels[nearest], -1), np.where(distances == 0, nearest, -1)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index into a directory
+
+        :param path: the path of the directory
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'features.npy'), self.features)
+        np.save(os.path.join(path, 'labels.npy'), self.labels)
+        np.save(os.path.join(path, 'counts.npy'), self.counts)
+        if len(self.representatives) > 0:
+            self.representatives.save(os.path.join(path, 'representatives'))
+
+    @staticmethod
+    def load(path: str, cls: Type) -> "ClusterIndex":
+        """
+        Loads an index saved with ClusterIndex.save
+
+        :param path: the path of the directory
+        :param cls: the class of the representative items
+        :return: the cluster index
+        """
+        representatives_path = os.path.join(path, 'representatives')
+        return ClusterIndex(
+            features=np.load(os.path.join(path, 'features.npy')),
+            labels=np.load(os.path.join(path, 'labels.npy')),
+            counts=np.load(os.path.join(path, 'counts.npy')),
+            representatives=(
+                GamePalsDataset.load(representatives_path, cls)
+                if os.path.isdir(representatives_path)
+                else GamePalsDataset()
+            ),
+        )
+
+
+@dataclass
+class ClusteringUpdate:
+    """
+    The result of clustering a new batch of items against an existing ClusterIndex
+
+    :ivar GamePalsDataset new_representatives: the representatives of the clusters started by the batch,
+        i.e. the items that still need to be labeled by the teacher
+    :ivar np.ndarray new_cluster_ids: the cluster label of each new representative
+    :ivar np.ndarray assignments: the cluster label of each item in the batch (-1 for noise)
+    """
+    new_representatives: GamePalsDataset
+    new_cluster_ids: np.ndarray
+    assignments: np.ndarray
@@ -0,0 +1,131 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN, MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+
+
+class ClusteringBackend(ABC):
+    """
+    ClusteringBackend is the abstract base class for the clustering algorithms used by a DatasetClusterer
+    """
+
+    @abstractmethod
+    def fit_predict(self, features: np.ndarray, sample_weight: np.ndarray) -> np.ndarray:
+        """
+        Clusters the rows of a features matrix
+
+        :param features: the features matrix
+        :param sample_weight: the weight of each row (i.e. how many items share it)
+        :return: the cluster label of each row, -1 for noise
+        """
+        pass
+
+
+class DBSCANBackend(ClusteringBackend):
+    """
+    Clusters with sklearn's DBSCAN
+    """
+
+    def __init__(self, eps: float = 1e-2, min_samples: int = 1, metric: str = "euclidean", n_jobs: int | None = None):
+        """
+        Creates a DBSCANBackend
+
+        :param eps: the maximum distance between two neighbouring items
+        :param min_samples: the (weighted) number of neighbours for an item to be a core item
+        :param metric: the distance metric
+        :param n_jobs: the number of parallel jobs for the neighbours search
+        """
+        self.eps = eps
+        self.min_samples = min_samples
+        self.metric = metric
+        self.n_jobs = n_jobs
+
+    def fit_predict(self, features: np.ndarray, sample_weight: np.ndarray) -> np.ndarray:
+        clustering = DBSCAN(
+            eps=self.eps,
+            min_samples=self.min_samples,
+            metric=self.metric,
+            n_jobs=self.n_jobs,
+        )
+        return clustering.fit_predict(features, sample_weight=sample_weight)
+
+
+class GridBackend(ClusteringBackend):
+    """
+    Clusters by bucketing features into a grid of cells of side eps: each non-empty cell is a cluster.
+    It is linear in the number of items and, for a tiny eps over bucketed features, it groups
+    items like DBSCAN would, although near-duplicates split by a cell boundary are not merged.
+    """
+
+    def __init__(self, eps: float = 1e-2):
+        """
+        Creates a GridBackend
+
+        :param eps: the side of the grid cells
+        """
+        self.eps = eps
+
+    def fit_predict(self, features: np.ndarray, sample_weight: np.ndarray) -> np.ndarray:
+        cells = np.floor(features / self.eps).astype(np.int64)
+        _, first_indices, labels = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+
+        # Number clusters in order of first occurrence, like DBSCAN does
+        rank = np.empty_like(first_indices)
+        rank[np.argsort(first_indices)] = np.arange(len(first_indices))
+        return rank[labels.ravel()]
+
+
+class RadiusNeighborsBackend(ClusteringBackend):
+    """
+    Clusters into the connected components of the eps-radius neighbours graph, built with a KD-tree
+    (or ball-tree). This is equivalent to DBSCAN with min_samples=1, but the neighbours search runs in parallel
+    and the graph is never expanded point by point.
+    """
+
+    def __init__(self, eps: float = 1e-2, algorithm: str = "kd_tree", n_jobs: int | None = None):
+        """
+        Creates a RadiusNeighborsBackend
+
+        :param eps: the maximum distance between two neighbouring items
+        :param algorithm: the neighbours index, either "kd_tree" or "ball_tree"
+        :param n_jobs: the number of parallel jobs for the neighbours search
+        """
+        self.eps = eps
+        self.algorithm = algorithm
+        self.n_jobs = n_jobs
+
+    def fit_predict(self, features: np.ndarray, sample_weight: np.ndarray) -> np.ndarray:
+        neighbours = NearestNeighbors(radius=self.eps, algorithm=self.algorithm, n_jobs=self.n_jobs)
+        neighbours.fit(features)
+        graph = neighbours.radius_neighbors_graph(features, mode="connectivity")
+        _, labels = connected_components(graph, directed=False)
+        return labels
+
+
+class MiniBatchKMeansBackend(ClusteringBackend):
+    """
+    Clusters with sklearn's MiniBatchKMeans, into (at most) a target number of clusters
+    """
+
+    def __init__(self, n_clusters: int, batch_size: int = 4096, random_state: int | None = 0):
+        """
+        Creates a MiniBatchKMeansBackend
+
+        :param n_clusters: the target number of clusters
+        :param batch_size: the size of the mini-batches
+        :param random_state: the seed of the clustering, for reproducibility
+        """
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def fit_predict(self, features: np.ndarray, sample_weight: np.ndarray) -> np.ndarray:
+        clustering = MiniBatchKMeans(
+            n_clusters=min(self.n_clusters, len(features)),
+            batch_size=self.batch_size,
+            random_state=self.random_state,
+            n_init="auto",
+        )
+        return clustering.fit_predict(features, sample_weight=sample_weight)
@@ -1,57 +1,189 @@
 from typing import Callable, Any, Iterable
-from sklearn.cluster import DBSCAN
 import numpy as np
 
 from core.datasets import GamePalsDatasetTransformer, GamePalsDataset
+from core.knowledge.clustering_backends import ClusteringBackend, DBSCANBackend
+from core.knowledge.cluster_index import ClusterIndex, ClusteringUpdate
 
 
 class DatasetClusterer(GamePalsDatasetTransformer):
     """
     A GamePalsDatasetTransformers specialized to cluster items in the dataset
     and only keep the cluster centers
+
+    :ivar ClusterIndex | None index: the clusters found so far, which new items can be incrementally assigned to
     """
 
     def __init__(
             self,
             to_features: Callable[[Any], Iterable],
+            to_features_batch: Callable[[Any], np.ndarray] | None = None,
+            backend: ClusteringBackend | None = None,
+            index: ClusterIndex | None = None,
     ):
         """
         Creates a DatasetClusterer
 
         :param to_features: the function that transforms each item in the dataset into its features vector
+        :param to_features_batch: the (optional) function that transforms a whole dataset into its features matrix,
+            equivalent to applying to_features to each item
+        :param backend: the clustering algorithm, DBSCAN(eps=1e-2, min_samples=1) by default
+        :param index: the clusters of a previous run (see ClusterIndex.load), to continue with update
         """
         self.to_features = to_features
+        self.to_features_batch = to_features_batch
+        self.backend = backend if backend else DBSCANBackend()
+        self.index = index
+
+    def features(self, x: GamePalsDataset) -> np.ndarray:
+        """
+        Computes the features matrix of a dataset, using the batch function when available
+
+        :param x: a gamepals dataset (or a columnar batch)
+        :return: the features matrix, with one row per item
+        """
+        if self.to_features_batch is not None:
+            return np.asarray(self.to_features_batch(x), dtype=np.float32)
+        return np.array([self.to_features(item) for item in x], dtype=np.float32)
 
     def transform(self, x: GamePalsDataset) -> GamePalsDataset:
         """
         Reduces the dataset to only its cluster centers
 
-        :param x: a gamepals dataset
-        :return: the new gamepals dataset
+        :param x: a gamepals dataset (or a columnar batch)
+        :return: the new gamepals dataset (or columnar batch)
         """
-        features = np.array([self.to_features(item) for item in x], dtype=np.float32)
+        features = self.features(x)
+
+        # Bucketed and one-hot features make most items exact duplicates:
+        # only cluster the unique rows, weighted by how many items share them
+        unique_features, first_indices, _, counts = self.collapse_duplicates(features)
 
-        clustering = DBSCAN(
-            eps=1e-2,
-            min_samples=1,
-            metric="euclidean",
+        labels, center_indices = self.cluster(unique_features, counts)
+        new_x = x.take(first_indices[center_indices])
+
+        clustered = labels != -1
+        self.index = ClusterIndex(
+            features=unique_features[clustered],
+            labels=labels[clustered],
+            counts=counts[clustered],
+            representatives=GamePalsDataset(new_x),
         )
-        labels = clustering.fit_predict(features)
+        return new_x
 
-        new_x = GamePalsDataset()
-        for cluster_id in set(labels):
-            if cluster_id == -1: continue
+    def update(self, x: GamePalsDataset, eps: float = 1e-2) -> ClusteringUpdate:
+        """
+        Incrementally clusters newly collected items, without re-clustering the items already in the index.
+        Items within eps of an indexed feature row join its cluster, the others are clustered among themselves
+        into new clusters, whose representatives are added to the index.
 
-            cluster_indices = np.where(labels == cluster_id)[0]
-            cluster_features = features[cluster_indices]
+        :param x: a gamepals dataset (or a columnar batch) of new items
+        :param eps: the maximum distance for an item to join an existing cluster
+        :return: the new representatives (which still need labeling) and the cluster of each item
+        """
+        if self.index is None:
+            self.index = ClusterIndex(
+                features=np.empty((0, 0), dtype=np.float32),
+                labels=np.empty(0, dtype=np.int64),
+                counts=np.empty(0, dtype=np.int64),
+                representatives=GamePalsDataset(),
+            )
 
-            # Compute centroid
-            centroid = cluster_features.mean(axis=0)
+        features = self.features(x)
+        unique_features, first_indices, inverse, counts = self.collapse_duplicates(features)
+        labels, known_rows = self.index.assign(unique_features, eps)
 
-            # Find the closest item to centroid
-            distances = np.linalg.norm(cluster_features - centroid, axis=1)
-            center_idx = cluster_indices[np.argmin(distances)]
+        # Cluster the items that do not belong to any existing cluster
+        pending = np.flatnonzero(labels == -1)
+        new_cluster_ids = np.empty(0, dtype=np.int64)
+        new_x = x.take([])
+        if len(pending) > 0:
+            pending_labels, center_indices = self.cluster(unique_features[pending], counts[pending])
+            new_cluster_ids = len(self.index) + np.arange(len(center_indices))
+            labels[pending] = np.where(pending_labels == -1, -1, pending_labels + len(self.index))
+            new_x = x.take(first_indices[pending[center_indices]])
 
-            new_x.append(x[center_idx])
+        # Grow the index with the feature rows it did not contain yet
+        known = known_rows != -1
+        np.add.at(self.index.counts, known_rows[known], counts[known])
+        added = ~known & (labels != -1)
+        self.index.features = np.vstack([self.index.features.reshape(-1, features.shape[1]), unique_features[added]])
+        self.index.labels = np.concatenate([self.index.labels, labels[added]])
+        self.index.counts = np.concatenate([self.index.counts, counts[added]])
+        self.index.representatives = GamePalsDataset(list(self.index.representatives) + list(new_x))
 
-        return new_x
+        return ClusteringUpdate(
+            new_representatives=new_x,
+            new_cluster_ids=new_cluster_ids,
+            assignments=labels[inverse],
+        )
+
+    def cluster(self, features: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Clusters unique feature rows with the backend, and finds the center of each cluster
+
+        :param features: the unique feature rows
+        :param counts: how many items share each row
+        :return: the cluster label of each row (renumbered from 0, -1 for noise),
+            and the index of the center row of each cluster, in order of label
+        """
+        labels = self.backend.fit_predict(features, sample_weight=counts)
+        center_indices = self.select_centers(features, labels, counts)
+
+        clusters = np.unique(labels[labels != -1])
+        return np.where(labels == -1, -1, np.searchsorted(clusters, labels)), center_indices
+
+    @staticmethod
+    def select_centers(features: np.ndarray, labels: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        Finds, for each cluster, the item closest to the (weighted) centroid of the cluster.
+        All clusters are handled in a single pass: items are sorted by label once, and the centroids
+        are computed with np.add.reduceat over the sorted segments.
+
+        :param features: the features matrix
+        :param labels: the cluster label of each row, -1 for noise
+        :param weights: the weight of each row
+        :return: the index of the center of each cluster, in order of label
+        """
+        clustered = np.flatnonzero(labels != -1)
+        if len(clustered) == 0:
+            return clustered
+
+        order = clustered[np.argsort(labels[clustered], kind='stable')]
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        segments = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(order)]))
+
+        sorted_features = features[order].astype(np.float64)
+        sorted_weights = weights[order].astype(np.float64)
+        centroids = (
+                np.add.reduceat(sorted_features * sorted_weights[:, None], starts, axis=0)
+                / np.add.reduceat(sorted_weights, starts)[:, None]
+        )
+        distances = np.linalg.norm(sorted_features - centroids[segments], axis=1)
+
+        # Within each segment, pick the closest item (the first one, in case of ties)
+        closest = np.lexsort((np.arange(len(order)), distances, segments))
+        return order[closest[starts]]
+
+    @staticmethod
+    def collapse_duplicates(features: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Collapses the exact duplicate rows of a features matrix.
+        Rows are compared by their raw bytes, and unique rows are kept in order of first occurrence,
+        so that ties are broken as if the duplicates were still there.
+
+        :param features: the features matrix
+        :return: the unique rows, the index of the first occurrence of each unique row,
+            the unique row of each original row, and the number of occurrences of each unique row
+        """
+        features = np.ascontiguousarray(features)
+        rows = features.view(np.dtype((np.void, features.dtype.itemsize * features.shape[1]))).ravel()
+        _, first_indices, inverse, counts = np.unique(
+            rows, return_index=True, return_inverse=True, return_counts=True
+        )
+
+        order = np.argsort(first_indices)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return features[first_indices[order]], first_indices[order], rank[inverse.ravel()], counts[order]
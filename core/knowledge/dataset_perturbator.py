@@ -1,35 +1,128 @@
-from typing import Callable, Any, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Any, Iterable, Iterator
+import numpy as np
 
-from core.datasets import GamePalsDatasetTransformer, GamePalsDataset
+from core.datasets import GamePalsDatasetTransformer, GamePalsDataset, ColumnarBatch
+from core.knowledge.augmented_dataset import AugmentedDataset
+
+
+def _perturbate_shard(
+        perturbate: Callable[[Any, np.random.Generator], Iterable],
+        seed: int,
+        start: int,
+        items: list,
+) -> list:
+    """
+    Produces the perturbations of a contiguous shard of a dataset, in a worker process
+
+    :param perturbate: the perturbation function
+    :param seed: the seed of the perturbator
+    :param start: the index of the first item of the shard in the dataset
+    :param items: the items of the shard
+    :return: the perturbations of the shard, in order
+    """
+    perturbations = list()
+    for i, item in enumerate(items):
+        perturbations.extend(perturbate(item, DatasetPerturbator.generator(seed, start + i)))
+    return perturbations
 
 
 class DatasetPerturbator(GamePalsDatasetTransformer):
     """
     A GamePalsDatasetTransformers specialized to apply small
     perturbations to a dataset.
+    Each item is perturbed with its own random stream, derived from the seed and the index of the item,
+    so the perturbations of any item can be regenerated on demand, and do not depend on how the work is split.
     """
 
     def __init__(
             self,
-            perturbate: Callable[[Any], Iterable],
+            perturbate: Callable[[Any, np.random.Generator], Iterable],
+            perturbate_batch: Callable[[Any, list[np.random.Generator]], Any] | None = None,
+            seed: int | None = None,
+            n_workers: int = 1,
+            count_perturbations: Callable[[Any], int] | None = None,
     ):
         """
         Creates a DatasetPerturbator
 
-        :param perturbate: the function that, given an item, produces its perturbations
+        :param perturbate: the function that, given an item and a random generator, produces its perturbations
+        :param perturbate_batch: the (optional) function that, given a columnar batch and the random generator
+            of each of its items, produces the perturbations of all its items at once (identical to the ones
+            of perturbate, item by item)
+        :param seed: the seed of all the perturbations, None to draw a random one (stored in self.seed)
+        :param n_workers: the number of processes the dataset is sharded across (1 perturbs in the current process)
+        :param count_perturbations: the (optional) function that, given an item, returns how many perturbations
+            perturbate produces for it without producing them
         """
         self.perturbate = perturbate
+        self.perturbate_batch = perturbate_batch
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.n_workers = n_workers
+        self.count_perturbations = count_perturbations
+
+    @staticmethod
+    def generator(seed: int, index: int) -> np.random.Generator:
+        """
+        Derives the independent random stream of an item
+
+        :param seed: the seed of the perturbator
+        :param index: the index of the item in the dataset
+        :return: the random generator of the item
+        """
+        return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+
+    def perturbations_of(self, item: Any, index: int) -> list:
+        """
+        Regenerates the perturbations of a single item
+
+        :param item: the item
+        :param index: the index of the item in the dataset
+        :return: the perturbations of the item, identical to the ones produced by transform
+        """
+        return list(self.perturbate(item, self.generator(self.seed, index)))
+
+    def augment(self, x: GamePalsDataset) -> AugmentedDataset:
+        """
+        Returns a virtual view of the perturbations of a dataset, which regenerates them on demand
+        instead of storing them. The view contains the same items as the output of transform.
+
+        :param x: a gamepals dataset
+        :return: the augmented dataset view
+        """
+        return AugmentedDataset(x, self)
 
     def transform(self, x: GamePalsDataset) -> GamePalsDataset:
         """
         Enlarges the dataset with the perturbations of its items
 
-        :param x: a gamepals dataset
-        :return: the new gamepals dataset
-        """
-        new_x = GamePalsDataset()
-        for item in x:
-            perturbations = self.perturbate(item)
-            for p in perturbations:
-                new_x.append(p)
-        return new_x
+        :param x: a gamepals dataset (or a columnar batch)
+        :return: the new gamepals dataset (or columnar batch)
+        """
+        if self.perturbate_batch is not None and isinstance(x, ColumnarBatch):
+            return self.perturbate_batch(x, [self.generator(self.seed, index) for index in range(len(x))])
+
+        if self.n_workers <= 1:
+            return GamePalsDataset(self.stream(x))
+
+        items = list(x)
+        shard_size = max(1, -(-len(items) // (4 * self.n_workers)))
+        with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+            shards = [
+                executor.submit(_perturbate_shard, self.perturbate, self.seed, start, items[start:start + shard_size])
+                for start in range(0, len(items), shard_size)
+            ]
+            new_x = GamePalsDataset()
+            for shard in shards:
+                new_x.items.extend(shard.result())
+            return new_x
+
+    def stream(self, items: Iterable) -> Iterator:
+        """
+        Lazily produces the perturbations of a stream of items
+
+        :param items: the stream of items
+        :return: the stream of perturbations
+        """
+        for index, item in enumerate(items):
+            yield from self.perturbate(item, self.generator(self.seed, index))
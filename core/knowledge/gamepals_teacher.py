@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Sequence
 
 from core.datasets import GamePalsDataset
 from core.knowledge.utils import UserCommandInfo
@@ -10,7 +11,8 @@ class GamePalsTeacher(ABC):
     in the Knowledge Distillation process of GamePals LLMs.
 
     :ivar GamePalsDataset game_states: the dataset of game states from which the teacher should elicit their knowledge
-    :ivar list[UserCommandInfo] user_commands: the list of commands generated by the teacher from the game states
+    :ivar Sequence[UserCommandInfo] user_commands: the commands generated by the teacher from the game states
+        (a list, or a columnar UserCommandBatch)
     :ivar list[str] labels: the list of outputs, each associated to a user command (and its game state)
     """
 
@@ -21,7 +23,7 @@ class GamePalsTeacher(ABC):
         :param game_states: the dataset of game states from which the teacher should elicit their knowledge
         """
         self.game_states = game_states
-        self.user_commands: list[UserCommandInfo] = []
+        self.user_commands: Sequence[UserCommandInfo] = []
         self.labels: list[str] = []
 
     @abstractmethod
@@ -0,0 +1,90 @@
+import json
+from typing import TypeVar, Generic, Type, Any
+
+from pydantic import TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+T = TypeVar('T')
+
+
+class TeacherOutputParser(Generic[T]):
+    """
+    Parses the output texts of a teacher model, made of one JSON record per line,
+    validating each record against a schema with a pydantic TypeAdapter.
+    Uses orjson to decode the lines when it is installed.
+    Blank lines are skipped. The output of a request with any malformed or invalid line is quarantined
+    (with its custom_id) instead of failing the whole parsing.
+    The parser is a context manager, which closes the quarantine file on exit.
+
+    :ivar int n_parsed: the number of outputs parsed successfully
+    :ivar int n_quarantined: the number of outputs quarantined
+    """
+
+    def __init__(self, cls: Type[T], quarantine_path: str | None = None):
+        """
+        Creates a TeacherOutputParser
+
+        :param cls: the type of the records (a dataclass or a pydantic model)
+        :param quarantine_path: the path of the JSONL file collecting the quarantined outputs, None to not store them
+        """
+        self.adapter = TypeAdapter(cls)
+        self.loads = orjson.loads if orjson is not None else json.loads
+        self.quarantine_file = open(quarantine_path, "w", encoding="utf-8") if quarantine_path is not None else None
+        self.n_parsed = 0
+        self.n_quarantined = 0
+
+    def parse(self, custom_id: str, output_text: str, **fields: Any) -> list[T]:
+        """
+        Parses the output of a request, all or nothing
+
+        :param custom_id: the custom_id of the request
+        :param output_text: the output text of the request
+        :param fields: the fields added to every record (e.g. the index of the item the request was built from)
+        :return: the records of the output, empty if the output was quarantined
+        """
+        records = list()
+        for line in output_text.split("\n"):
+            if not line.strip():
+                continue
+            try:
+                data = self.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+                records.append(self.adapter.validate_python({**data, **fields}))
+            except (ValueError, ValidationError) as e:
+                self.quarantine(custom_id, output_text, e)
+                return []
+
+        self.n_parsed += 1
+        return records
+
+    def quarantine(self, custom_id: str, output_text: str, error: Exception) -> None:
+        """
+        Quarantines the output of a request
+
+        :param custom_id: the custom_id of the request
+        :param output_text: the output text of the request
+        :param error: the error raised while parsing the output
+        """
+        self.n_quarantined += 1
+        if self.quarantine_file is not None:
+            record = {"custom_id": custom_id, "error": str(error), "output": output_text}
+            self.quarantine_file.write(json.dumps(record) + "\n")
+            self.quarantine_file.flush()
+
+    def close(self) -> None:
+        """
+        Closes the quarantine file, if any
+        """
+        if self.quarantine_file is not None:
+            self.quarantine_file.close()
+
+    def __enter__(self) -> "TeacherOutputParser[T]":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class TeacherRequests:
+    """
+    The requests of a stage of a teacher (e.g. user command generation or labeling), one per item.
+    Items are identified by an integer index, and their requests by a custom_id made of a prefix and that index.
+
+    :ivar str system_prompt: the full prompt shared by all the requests
+    :ivar Callable[[list[int]], list[str]] render: the function building the user contents of the requests of some items
+    :ivar str input_filepath: the base path of the batch input files of the requests
+    :ivar str id_prefix: the prefix of the custom_ids of the requests
+    :ivar int n_items: the number of items (indexed from 0 to n_items - 1)
+    """
+    system_prompt: str
+    render: Callable[[list[int]], list[str]]
+    input_filepath: str
+    id_prefix: str
+    n_items: int
+
+    def custom_id(self, idx: int) -> str:
+        """
+        Returns the custom_id of the request of an item
+
+        :param idx: the index of the item
+        :return: the custom_id
+        """
+        return f"{self.id_prefix}{idx}"
+
+    def item_of(self, custom_id: str) -> int:
+        """
+        Returns the item of a request
+
+        :param custom_id: the custom_id of the request
+        :return: the index of the item
+        """
+        return int(custom_id.removeprefix(self.id_prefix))
@@ -0,0 +1,64 @@
+from typing import Iterable, Type
+
+import numpy as np
+
+from core.datasets import ColumnarBatch
+from core.knowledge.utils import UserCommandInfo
+
+
+class UserCommandBatch(ColumnarBatch[UserCommandInfo]):
+    """
+    A struct-of-arrays batch of UserCommandInfos.
+    The scores are float32 columns, game_state_idx is an int32 column, and the command and intent
+    strings are dictionary-encoded. Saved batches are memory-mapped when loaded.
+    """
+
+    @classmethod
+    def from_commands(cls, commands: Iterable[UserCommandInfo]) -> "UserCommandBatch":
+        """
+        Builds a UserCommandBatch from a collection of user commands
+
+        :param commands: the user commands
+        :return: the user command batch
+        """
+        return cls.from_items(commands, UserCommandInfo)
+
+    @classmethod
+    def load(
+            cls,
+            path: str,
+            item_cls: Type[UserCommandInfo] = UserCommandInfo,
+            fields: Iterable[str] | None = None,
+            mmap_mode: str | None = 'r'
+    ) -> "UserCommandBatch":
+        return super().load(path, item_cls, fields, mmap_mode)
+
+    def group_by_state(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Groups the commands by the game state they were generated for
+
+        :return: the distinct game state indices (sorted), the CSR-style offsets of their groups,
+            and the order of the commands such that group i is order[offsets[i]:offsets[i+1]]
+        """
+        state_indices = self.columns['game_state_idx']
+        if np.all(state_indices[:-1] <= state_indices[1:]):
+            order = np.arange(len(self))
+        else:
+            order = np.argsort(state_indices, kind='stable')
+        sorted_indices = state_indices[order]
+
+        if len(self) == 0:
+            return sorted_indices, np.zeros(1, dtype=np.int64), order
+
+        starts = np.flatnonzero(np.r_[True, sorted_indices[1:] != sorted_indices[:-1]])
+        offsets = np.append(starts, len(self))
+        return sorted_indices[starts], offsets, order
+
+    def commands_of(self, game_state_idx: int) -> "UserCommandBatch":
+        """
+        Selects the commands generated for a game state
+
+        :param game_state_idx: the index of the game state
+        :return: the user command batch of its commands
+        """
+        return self.take(np.flatnonzero(self.columns['game_state_idx'] == game_state_idx))
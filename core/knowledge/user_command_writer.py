@@ -0,0 +1,71 @@
+import os
+import shutil
+
+from core.knowledge.user_command_batch import UserCommandBatch
+from core.knowledge.utils import UserCommandInfo
+
+
+class UserCommandWriter:
+    """
+    Writes user commands to a columnar store incrementally, as they are generated,
+    without holding all of them in memory. Appended commands are buffered and saved as parts of part_size commands
+    (readable as soon as they are written), and the parts are merged into a single UserCommandBatch directory
+    when the writer is closed.
+    """
+
+    def __init__(self, path: str, part_size: int = 10_000):
+        """
+        Creates a UserCommandWriter, clearing any store at the given path
+
+        :param path: the path of the UserCommandBatch directory
+        :param part_size: the number of commands buffered before a part is saved
+        """
+        self.path = path
+        self.parts_path = f"{path}.parts"
+        self.part_size = part_size
+        self.buffer: list[UserCommandInfo] = list()
+        self.count = 0
+        self.n_parts = 0
+        for stale in (path, self.parts_path):
+            if os.path.isdir(stale):
+                shutil.rmtree(stale)
+        os.makedirs(self.parts_path)
+
+    def append(self, commands: list[UserCommandInfo]) -> None:
+        """
+        Appends user commands to the store
+
+        :param commands: the user commands
+        """
+        self.buffer.extend(commands)
+        self.count += len(commands)
+        if len(self.buffer) >= self.part_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Saves the buffered commands as a part
+        """
+        if not self.buffer:
+            return
+        UserCommandBatch.from_commands(self.buffer).save(os.path.join(self.parts_path, f"{self.n_parts:05d}"))
+        self.n_parts += 1
+        self.buffer = list()
+
+    def close(self) -> None:
+        """
+        Merges the parts into the final store
+        """
+        if not os.path.isdir(self.parts_path):
+            return
+        self.flush()
+        parts = [UserCommandBatch.load(os.path.join(self.parts_path, f"{i:05d}")) for i in range(self.n_parts)]
+        batch = UserCommandBatch.concat(parts) if parts else UserCommandBatch.from_commands([])
+        batch.save(self.path)
+        shutil.rmtree(self.parts_path)
+
+    def __enter__(self) -> "UserCommandWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
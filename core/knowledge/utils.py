@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class UserCommandInfo:
     """
     Dataclass containing information about a user command
@@ -14,8 +14,8 @@ class UserCommandInfo:
     :ivar float contextuality: a measure of how relevant the game state is to the execution of the command
     """
     command: str
-    game_state_idx: int
-    explicitness: float
-    atomicity: float
-    contextuality: float
+    game_state_idx: int = field(metadata={'dtype': 'int32'})
+    explicitness: float = field(metadata={'dtype': 'float32'})
+    atomicity: float = field(metadata={'dtype': 'float32'})
+    contextuality: float = field(metadata={'dtype': 'float32'})
     intent: str
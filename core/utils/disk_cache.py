@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+
+class DiskCache:
+    """
+    A persistent string-to-string cache, stored in a SQLite database,
+    with a bounded in-memory LRU layer in front of it.
+    The database can be bounded in size too: once it grows past max_disk_bytes,
+    the least recently written entries are evicted.
+
+    :ivar int hits: the number of lookups that found their key
+    :ivar int misses: the number of lookups that did not find their key
+    """
+
+    def __init__(self, path: str | None = None, max_memory_items: int = 100_000, max_disk_bytes: int | None = None):
+        """
+        Creates a DiskCache
+
+        :param path: the path of the SQLite database, None to only keep the in-memory layer
+        :param max_memory_items: the maximum number of entries kept in memory
+        :param max_disk_bytes: the maximum size of the keys and values stored in the database, None for no limit
+        """
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_bytes = 0
+        self.evictions = 0
+        self.memory: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.db.commit()
+            self.disk_bytes = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) FROM cache"
+            ).fetchone()[0]
+
+    def _remember(self, key: str, value: str) -> None:
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        """
+        Looks up a key
+
+        :param key: the key
+        :return: the cached value, None if the key is not cached
+        """
+        return self.get_many([key])[key]
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str | None]:
+        """
+        Looks up many keys at once, with a single query for the ones that are not in memory
+
+        :param keys: the keys
+        :return: the cached value of each key, None for the keys that are not cached
+        """
+        keys = list(keys)
+        with self.lock:
+            found = dict()
+            missing = list()
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                else:
+                    missing.append(key)
+
+            if self.db is not None and missing:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self.db.execute(
+                        f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    )
+                    for key, value in rows:
+                        found[key] = value
+                        self._remember(key, value)
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+            return {key: found.get(key) for key in keys}
+
+    def put(self, key: str, value: str) -> None:
+        """
+        Stores a value
+
+        :param key: the key
+        :param value: the value
+        """
+        self.put_many({key: value})
+
+    def put_many(self, items: dict[str, str]) -> None:
+        """
+        Stores many values at once, in a single transaction
+
+        :param items: the values, by key
+        """
+        with self.lock:
+            for key, value in items.items():
+                self._remember(key, value)
+            if self.db is not None and items:
+                # Replaced entries no longer count with their previous value
+                keys = list(items)
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    self.disk_bytes -= self.db.execute(
+                        f"SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) FROM cache "
+                        f"WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchone()[0]
+                self.db.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", items.items())
+                self.disk_bytes += sum(len(key) + len(value) for key, value in items.items())
+                if self.max_disk_bytes is not None and self.disk_bytes > self.max_disk_bytes:
+                    self._evict()
+                self.db.commit()
+
+    def _evict(self, chunk_size: int = 1000) -> None:
+        # Rows are replaced on write, so the lowest rowids are the least recently written entries
+        while self.disk_bytes > self.max_disk_bytes:
+            rows = self.db.execute(
+                "SELECT rowid, key, LENGTH(key) + LENGTH(value) FROM cache ORDER BY rowid LIMIT ?", (chunk_size,)
+            ).fetchall()
+            if not rows:
+                self.disk_bytes = 0
+                break
+            evicted = list()
+            for rowid, key, size in rows:
+                if self.disk_bytes <= self.max_disk_bytes:
+                    break
+                evicted.append((rowid,))
+                self.memory.pop(key, None)
+                self.disk_bytes -= size
+            self.db.executemany("DELETE FROM cache WHERE rowid = ?", evicted)
+            self.evictions += len(evicted)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit, miss and eviction counts of the cache, and the size of its database
+
+        :return: a dictionary with the hits, misses, evictions and disk bytes
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'disk_bytes': self.disk_bytes}
@@ -0,0 +1,266 @@
+import asyncio
+import bisect
+import contextlib
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, BinaryIO, Callable, Iterator
+
+import httpx
+from openai import InternalServerError
+
+
+def echo(body: dict[str, Any]) -> str:
+    """
+    The default answer of the fake API: the content of the last message of the request
+
+    :param body: the body of the Responses API request
+    :return: the output text
+    """
+    return body["input"][-1]["content"]
+
+
+class _FakeFileContent:
+    """The content of a file of the fake API, exposing the accessors of the SDK responses."""
+
+    def __init__(self, lines: list[bytes]):
+        self.lines = lines
+
+    @property
+    def content(self) -> bytes:
+        return b"\n".join(self.lines)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def read(self) -> bytes:
+        return self.content
+
+    def iter_lines(self) -> Iterator[str]:
+        for line in self.lines:
+            yield line.decode("utf-8")
+
+
+class FakeOpenAI:
+    """
+    An in-process fake of the OpenAI files, batches and responses APIs, for testing and load-testing
+    the teacher pipeline offline. It can be passed wherever an OpenAI client is expected.
+
+    Batches progress in real time: after batch_latency seconds of validation, each batch processes
+    throughput requests per second. A failure_rate fraction of the requests fail: in batches they are
+    reported in the error file, and direct calls to responses.create raise an InternalServerError.
+
+    :ivar int n_requests: the number of requests answered (in batches or directly)
+    :ivar int n_failed: the number of requests that failed
+    :ivar int n_batches: the number of batches created
+    :ivar int max_running_batches: the maximum number of batches seen running at once
+    """
+
+    def __init__(
+            self,
+            respond: Callable[[dict[str, Any]], str] = echo,
+            latency: float = 0.0,
+            failure_rate: float = 0.0,
+            throughput: float | None = None,
+            batch_latency: float = 0.0,
+            seed: int | None = None,
+    ):
+        """
+        Creates a FakeOpenAI
+
+        :param respond: the function computing the output text of a request, from its Responses API body
+        :param latency: the duration (in seconds) of a direct call to responses.create
+        :param failure_rate: the probability of a request failing
+        :param throughput: the number of requests a batch processes per second, None to process them instantly
+        :param batch_latency: the duration (in seconds) of the validation of a batch, before it starts processing
+        :param seed: the seed of the failures
+        """
+        self.respond = respond
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.throughput = throughput
+        self.batch_latency = batch_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.file_contents: dict[str, list[bytes]] = dict()
+        self.batch_jobs: dict[str, dict[str, Any]] = dict()
+        self.n_requests = 0
+        self.n_failed = 0
+        self.n_batches = 0
+        self.max_running_batches = 0
+
+        self.files = SimpleNamespace(
+            create=self._create_file,
+            content=self._file_content,
+            with_streaming_response=SimpleNamespace(content=self._stream_file_content),
+        )
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+        self.responses = SimpleNamespace(create=self._create_response)
+
+    def with_options(self, **options: Any) -> "FakeOpenAI":
+        """
+        Mirrors OpenAI.with_options: the fake has no client options, so it returns itself
+
+        :return: the fake client
+        """
+        return self
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the request, failure and batch counts of the fake API
+
+        :return: a dictionary with the statistics
+        """
+        return dict(
+            n_requests=self.n_requests,
+            n_failed=self.n_failed,
+            n_batches=self.n_batches,
+            max_running_batches=self.max_running_batches,
+        )
+
+    def _failed(self) -> bool:
+        return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def _add_file(self, lines: list[bytes]) -> str:
+        with self.lock:
+            file_id = f"file-{len(self.file_contents)}"
+            self.file_contents[file_id] = lines
+        return file_id
+
+    def _create_file(self, file: BinaryIO | bytes, purpose: str) -> SimpleNamespace:
+        data = file if isinstance(file, bytes) else file.read()
+        lines = [line for line in data.splitlines() if line]
+        return SimpleNamespace(id=self._add_file(lines), purpose=purpose, bytes=len(data))
+
+    def _file_content(self, file_id: str) -> _FakeFileContent:
+        return _FakeFileContent(self.file_contents[file_id])
+
+    def _stream_file_content(self, file_id: str) -> contextlib.AbstractContextManager[_FakeFileContent]:
+        return contextlib.nullcontext(self._file_content(file_id))
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str, **kwargs: Any) -> SimpleNamespace:
+        requests = [json.loads(line) for line in self.file_contents[input_file_id]]
+        with self.lock:
+            batch_id = f"batch-{len(self.batch_jobs)}"
+            failed = [position for position in range(len(requests)) if self._failed()]
+            self.batch_jobs[batch_id] = dict(
+                requests=requests,
+                failed=failed,
+                created_at=time.monotonic(),
+                output_file_id=None,
+                error_file_id=None,
+                ended=False,
+            )
+            self.n_batches += 1
+            # Count the new batch as running before it can end (instantly, without throughput)
+            self._update_running_batches()
+        return self._retrieve_batch(batch_id)
+
+    def _retrieve_batch(self, batch_id: str) -> SimpleNamespace:
+        job = self.batch_jobs[batch_id]
+        total = len(job["requests"])
+        elapsed = time.monotonic() - job["created_at"] - self.batch_latency
+
+        if elapsed < 0:
+            status, processed = "validating", 0
+        else:
+            processed = total if self.throughput is None else min(total, int(elapsed * self.throughput))
+            status = "completed" if processed == total else "in_progress"
+        n_failed = bisect.bisect_left(job["failed"], processed)
+
+        with self.lock:
+            self._update_running_batches()
+            if status == "completed" and not job["ended"]:
+                self._end_batch(job)
+
+        return SimpleNamespace(
+            id=batch_id,
+            status=status,
+            request_counts=SimpleNamespace(total=total, completed=processed - n_failed, failed=n_failed),
+            output_file_id=job["output_file_id"],
+            error_file_id=job["error_file_id"],
+        )
+
+    def _update_running_batches(self) -> None:
+        """Update the maximum number of batches seen running at once (called with the lock held)."""
+        running = sum(1 for job in self.batch_jobs.values() if not job["ended"])
+        self.max_running_batches = max(self.max_running_batches, running)
+
+    def _end_batch(self, job: dict[str, Any]) -> None:
+        """Answer the requests of a batch and write its output and error files (called with the lock held)."""
+        failed = set(job["failed"])
+        output_lines, error_lines = list(), list()
+        for position, request in enumerate(job["requests"]):
+            record = {"id": f"batch_req_{position}", "custom_id": request["custom_id"]}
+            if position in failed:
+                record.update(response=None, error={"code": "server_error", "message": "Injected failure"})
+                error_lines.append(json.dumps(record).encode("utf-8"))
+                continue
+            text = self.respond(request["body"])
+            output = [{"type": "message", "content": [{"type": "output_text", "text": text}]}]
+            usage = {"input_tokens": self._count_tokens(request["body"]), "output_tokens": -(-len(text) // 4)}
+            record.update(response={"status_code": 200, "body": {"output": output, "usage": usage}}, error=None)
+            output_lines.append(json.dumps(record).encode("utf-8"))
+
+        self.n_requests += len(job["requests"])
+        self.n_failed += len(failed)
+        for key, lines in (("output_file_id", output_lines), ("error_file_id", error_lines)):
+            if lines:
+                file_id = f"file-{len(self.file_contents)}"
+                self.file_contents[file_id] = lines
+                job[key] = file_id
+        # The requests are only needed until the batch ends
+        job["requests"] = [None] * len(job["requests"])
+        job["ended"] = True
+
+    @staticmethod
+    def _count_tokens(body: dict[str, Any]) -> int:
+        """Estimate the input tokens of a request, at 4 characters per token plus 4 tokens per message."""
+        return sum(-(-len(message["content"]) // 4) + 4 for message in body["input"])
+
+    def _answer(self, params: dict[str, Any]) -> SimpleNamespace:
+        with self.lock:
+            self.n_requests += 1
+            failed = self._failed()
+            if failed:
+                self.n_failed += 1
+        if failed:
+            request = httpx.Request("POST", "https://fake.openai/v1/responses")
+            raise InternalServerError(
+                "Injected failure", response=httpx.Response(500, request=request), body=None
+            )
+        return SimpleNamespace(output_text=self.respond(params))
+
+    def _create_response(self, **params: Any) -> SimpleNamespace:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self._answer(params)
+
+
+class AsyncFakeOpenAI(FakeOpenAI):
+    """
+    The asyncio variant of FakeOpenAI, which can be passed wherever an AsyncOpenAI client is expected:
+    responses.create is a coroutine, and the client is an async context manager.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.responses = SimpleNamespace(create=self._create_response_async)
+
+    async def _create_response_async(self, **params: Any) -> SimpleNamespace:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return self._answer(params)
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "AsyncFakeOpenAI":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
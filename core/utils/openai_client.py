@@ -1,18 +1,27 @@
+import asyncio
 import json
+import os
+import random
 import time
 import math
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import TypeVar, Generic, Callable, Optional, Any
+from typing import TypeVar, Generic, Callable, Optional, Any, Iterable, Iterator
 from dataclasses import dataclass
 from enum import Enum
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+
+from core.utils.rate_limiter import RateLimiter
+from core.utils.response_cache import ResponseCache
+from core.utils.token_counter import TokenCounter
 
 
 class ProcessingMode(Enum):
     """Processing mode for dataset."""
     SEQUENTIAL = "sequential"  # One-by-one API calls
     BATCH = "batch"  # Batch API processing
+    CONCURRENT = "concurrent"  # Many API calls in flight at once
 
 
 class BatchStatus(Enum):
@@ -29,7 +38,8 @@ class OpenAIClient:
     """
     A client for processing datasets with OpenAI API.
 
-    Supports both sequential and batch processing modes.
+    Supports sequential, batch and concurrent processing modes,
+    and streaming results from an iterable of items on a thread pool.
     """
 
     def __init__(
@@ -39,7 +49,16 @@ class OpenAIClient:
             max_output_tokens: int = 1024,
             temperature: float = 1.0,
             working_dir: Path = Path("./data/openai-client"),
-            api_key: Optional[str] = None
+            api_key: Optional[str] = None,
+            base_url: Optional[str] = None,
+            max_concurrency: int = 16,
+            requests_per_minute: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None,
+            max_retries: int = 5,
+            cache_path: Optional[str] = None,
+            cache_max_bytes: Optional[int] = None,
+            client: Optional[Any] = None,
+            async_client: Optional[Any] = None,
     ):
         """
         Creates an OpenAIClient instance.
@@ -50,14 +69,32 @@ class OpenAIClient:
         :param temperature: Sampling temperature (0-2)
         :param working_dir: Directory for temporary files
         :param api_key: OpenAI API key (uses environment variable if not provided)
+        :param base_url: the base URL of the API (uses the OpenAI one if not provided), e.g. of a local stub server
+        :param max_concurrency: Maximum number of requests in flight at once (concurrent mode)
+        :param requests_per_minute: Maximum requests per minute, None for no limit (concurrent mode)
+        :param tokens_per_minute: Maximum tokens per minute, None for no limit (concurrent mode)
+        :param max_retries: Maximum retries of a request failing with 429 or 5xx (concurrent mode)
+        :param cache_path: Path of the on-disk response cache, None to disable caching
+        :param cache_max_bytes: Maximum size of the response cache, None for no limit
+        :param client: Client of the API (e.g. a FakeOpenAI to run offline), None for an OpenAI client
+        :param async_client: Asyncio client of the API (concurrent mode), None for an AsyncOpenAI client
         """
-        self.client = OpenAI(api_key=api_key) if api_key else OpenAI()
+        self.client = client if client is not None else OpenAI(api_key=api_key, base_url=base_url)
+        self.async_client = async_client
+        self.api_key = api_key
+        self.base_url = base_url
         self.model = model
         self.mode = mode
         self.max_output_tokens = max_output_tokens
         self.temperature = temperature
         self.working_dir = working_dir
         self.working_dir.mkdir(parents=True, exist_ok=True)
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.token_counter = TokenCounter(model)
+        self.response_cache = ResponseCache(cache_path, cache_max_bytes) if cache_path else None
 
     def process(
             self,
@@ -72,6 +109,32 @@ class OpenAIClient:
         print(f"Processing mode: {self.mode.value}")
         print(f"Model: {self.model}")
 
+        if self.response_cache is None:
+            return self._dispatch(dataset, system_prompt, batch_size, request_delay)
+
+        # Only the requests that were never answered are sent
+        keys = ResponseCache.keys(self._envelope(system_prompt), dataset)
+        cached = self.response_cache.get_many(keys)
+        misses = [idx for idx, key in enumerate(keys) if cached[key] is None]
+        print(f"Response cache: {len(dataset) - len(misses)} hit(s), {len(misses)} miss(es)")
+
+        results = [cached[key] for key in keys]
+        if misses:
+            outputs = self._dispatch([dataset[idx] for idx in misses], system_prompt, batch_size, request_delay)
+            for idx, output in zip(misses, outputs):
+                results[idx] = output
+            self.response_cache.put_many({keys[idx]: output for idx, output in zip(misses, outputs) if output is not None})
+
+        return results
+
+    def _dispatch(
+            self,
+            dataset: list[str],
+            system_prompt: str,
+            batch_size: int,
+            request_delay: float
+    ) -> list:
+        """Process the dataset with the processing mode of the client."""
         match self.mode:
             case ProcessingMode.SEQUENTIAL:
                 return self._process_sequential(
@@ -85,6 +148,54 @@ class OpenAIClient:
                     system_prompt,
                     batch_size
                 )
+            case ProcessingMode.CONCURRENT:
+                return asyncio.run(self._process_concurrent(
+                    dataset,
+                    system_prompt
+                ))
+
+    def _envelope(self, system_prompt: str) -> str:
+        """Serialize the part of the requests shared by every item, in the processing mode of the client."""
+        if self.mode == ProcessingMode.BATCH:
+            return ResponseCache.envelope(**self._batch_body(system_prompt, ""))
+        return ResponseCache.envelope(**self._request_params(system_prompt, ""))
+
+    def _batch_body(self, system_prompt: str, item: str) -> dict[str, Any]:
+        """Build the body of a Batch API request for an item."""
+        return {
+            "model": self.model,
+            "max_output_tokens": self.max_output_tokens,
+            "temperature": self.temperature,  # TODO: verify if ignored or used
+            "input": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": item
+                }
+            ]
+        }
+
+    def _request_params(self, system_prompt: str, item: str) -> dict[str, Any]:
+        """Build the parameters of a Responses API call for an item."""
+        return dict(
+            model=self.model,
+            input=[
+                {
+                    "role": "developer",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": item
+                }
+            ],
+            reasoning={"effort": "low"},
+            max_output_tokens=self.max_output_tokens,
+            temperature=self.temperature,
+        )
 
     def _process_sequential(
             self,
@@ -104,28 +215,8 @@ class OpenAIClient:
 
             try:
                 # Make API call
-                response = self.client.responses.create(
-                    model=self.model,
-                    input=[
-                        {
-                            "role": "developer",
-                            "content": system_prompt
-                        },
-                        {
-                            "role": "user",
-                            "content": '' # TODO
-                        }
-                    ],
-                    reasoning={"effort": "low"},
-                    max_output_tokens=self.max_output_tokens,
-                    temperature=self.temperature,
-                )
-
-                result = '\n'.join([
-                    out.content.text
-                    for out in response.output
-                    if out.type == 'message' and out.content.type == 'output_text'
-                ])
+                response = self.client.responses.create(**self._request_params(system_prompt, item))
+                result = response.output_text
             except Exception as e:
                 print(e)
                 result = None
@@ -135,11 +226,185 @@ class OpenAIClient:
             if request_delay > 0:
                 time.sleep(request_delay)
 
-        successful = sum(1 for r in results if r.success)
+        successful = sum(1 for r in results if r is not None)
+        print(f"\nCompleted: {successful}/{total} successful")
+
+        return results
+
+    async def _process_concurrent(
+            self,
+            dataset: list[str],
+            system_prompt: str,
+    ) -> list:
+        """
+        Process the dataset with many requests in flight at once, bounded by max_concurrency
+        and rate-limited by requests and tokens per minute. Requests failing with 429 or 5xx errors
+        are retried with jittered exponential backoff. Results are returned in input order.
+        """
+        total = len(dataset)
+        print(f"Processing {total} items concurrently (up to {self.max_concurrency} in flight)")
+
+        # Retries are handled here, so that they go through the rate limiter too
+        if self.async_client is not None:
+            client = self.async_client.with_options(max_retries=0)
+        else:
+            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        system_tokens = self.token_counter.count_constant(system_prompt)
+
+        results = [None] * total
+        items = iter(enumerate(dataset))
+
+        async def request(item: str) -> Optional[str]:
+            n_tokens = system_tokens + self.token_counter.count(item) + self.max_output_tokens
+            for attempt in range(self.max_retries + 1):
+                await limiter.acquire(n_tokens)
+                try:
+                    response = await client.responses.create(**self._request_params(system_prompt, item))
+                    return response.output_text
+                except (APIConnectionError, APITimeoutError, APIStatusError) as e:
+                    retryable = not isinstance(e, APIStatusError) or e.status_code == 429 or e.status_code >= 500
+                    if not retryable or attempt == self.max_retries:
+                        print(e)
+                        return None
+                    await asyncio.sleep(self._backoff(attempt, e))
+                except Exception as e:
+                    print(e)
+                    return None
+
+        # Each worker takes the next item as soon as its previous request completes
+        async def worker() -> None:
+            for idx, item in items:
+                results[idx] = await request(item)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, total))))
+        finally:
+            # An injected client is owned by the caller
+            if self.async_client is None:
+                await client.close()
+
+        successful = sum(1 for r in results if r is not None)
         print(f"\nCompleted: {successful}/{total} successful")
 
         return results
 
+    def process_stream(
+            self,
+            items: Iterable[str],
+            system_prompt: str,
+            max_workers: Optional[int] = None,
+            max_in_flight: Optional[int] = None,
+            checkpoint_path: Optional[str] = None,
+    ) -> Iterator[tuple[int, Optional[str]]]:
+        """
+        Process a stream of items on a thread pool, yielding each result as soon as it completes.
+        Items are only pulled from the iterable while fewer than max_in_flight of them are pending,
+        so neither the inputs nor the outputs are ever held in memory all at once.
+        Requests failing with 429 or 5xx errors are retried with jittered exponential backoff.
+
+        With a checkpoint file, the index of each successful result is recorded once it has been consumed:
+        an interrupted run called again with the same items and checkpoint only sends the remaining ones.
+
+        :param items: the items to process (any iterable, e.g. a generator reading a file)
+        :param system_prompt: the system prompt shared by every request
+        :param max_workers: the number of threads sending requests, None for max_concurrency
+        :param max_in_flight: the maximum number of items submitted and not yet yielded, None for twice max_workers
+        :param checkpoint_path: the path of the file recording the completed indices, None to disable checkpointing
+        :return: an iterator of (index, result) pairs in completion order, the result being None for failed requests
+        """
+        max_workers = max_workers or self.max_concurrency
+        max_in_flight = max(max_in_flight or 2 * max_workers, max_workers)
+
+        completed = set()
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                completed = {int(line) for line in f if line.strip()}
+            print(f"Resuming from {checkpoint_path}: {len(completed)} item(s) already completed")
+        checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path is not None else None
+
+        # Retries are handled here, with the same policy as the concurrent mode
+        client = self.client.with_options(max_retries=0)
+        envelope = ResponseCache.envelope(**self._request_params(system_prompt, ""))
+
+        def request(item: str) -> Optional[str]:
+            key = None
+            if self.response_cache is not None:
+                key = ResponseCache.keys(envelope, [item])[0]
+                cached = self.response_cache.get_many([key])[key]
+                if cached is not None:
+                    return cached
+
+            result = self._request_with_retries(client, system_prompt, item)
+            if key is not None and result is not None:
+                self.response_cache.put_many({key: result})
+            return result
+
+        pending: dict[Future, int] = dict()
+        remaining = ((idx, item) for idx, item in enumerate(items) if idx not in completed)
+        n_done, n_successful = 0, 0
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            exhausted = False
+            while pending or not exhausted:
+                # Backpressure: the next items are only pulled once earlier ones were yielded
+                while not exhausted and len(pending) < max_in_flight:
+                    next_item = next(remaining, None)
+                    if next_item is None:
+                        exhausted = True
+                        break
+                    idx, item = next_item
+                    pending[executor.submit(request, item)] = idx
+
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = pending.pop(future)
+                    result = future.result()
+                    yield idx, result
+
+                    n_done += 1
+                    if result is not None:
+                        n_successful += 1
+                        if checkpoint is not None:
+                            checkpoint.write(f"{idx}\n")
+                            checkpoint.flush()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if checkpoint is not None:
+                checkpoint.close()
+
+        print(f"\nCompleted: {n_successful}/{n_done} successful")
+
+    def _request_with_retries(self, client: OpenAI, system_prompt: str, item: str) -> Optional[str]:
+        """Send the request of an item, retrying on 429 and 5xx errors; None if it fails."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = client.responses.create(**self._request_params(system_prompt, item))
+                return response.output_text
+            except (APIConnectionError, APITimeoutError, APIStatusError) as e:
+                retryable = not isinstance(e, APIStatusError) or e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt == self.max_retries:
+                    print(e)
+                    return None
+                time.sleep(self._backoff(attempt, e))
+            except Exception as e:
+                print(e)
+                return None
+
+    @staticmethod
+    def _backoff(attempt: int, error: Exception, base: float = 1.0, cap: float = 60.0) -> float:
+        """Compute the delay before retrying a request: the server's Retry-After if given, else jittered exponential."""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
     def _process_batch(
             self,
             dataset: list[str],
@@ -150,6 +415,8 @@ class OpenAIClient:
 
         print(f"Processing {len(dataset)} items in {num_batches} batch(es)")
 
+        all_results = {}
+
         for batch_num in range(num_batches):
             start_idx = batch_num * batch_size
             end_idx = min((batch_num + 1) * batch_size, len(dataset))
@@ -215,21 +482,7 @@ class OpenAIClient:
                     "custom_id": custom_id,
                     "method": "POST",
                     "url": "/v1/responses",
-                    "body": {
-                        "model": self.model,
-                        "max_output_tokens": self.max_output_tokens,
-                        "temperature": self.temperature,  # TODO: verify if ignored or used
-                        "input": [
-                            {
-                                "role": "system",
-                                "content": system_prompt
-                            },
-                            {
-                                "role": "user",
-                                "content": '' # TODO (game state to prompt ready)
-                            }
-                        ]
-                    }
+                    "body": self._batch_body(system_prompt, item)
                 }
 
                 f.write(json.dumps(request) + "\n")
@@ -288,25 +541,28 @@ class OpenAIClient:
             raise RuntimeError(f"Batch {batch_id} not completed: {batch.status}")
 
         output_file_id = batch.output_file_id
-        content = self.client.files.content(output_file_id)
 
+        # Stream the output file line by line instead of downloading it whole
         results = {}
-        for line in content.iter_lines():
-            record = json.loads(line)
-            custom_id = record["custom_id"]
-
-            # Extract item index from custom_id
-            try:
-                output_text = ""
-                for item in record["response"]["body"]["output"]:
-                    for content_item in item["content"]:
-                        if content_item["type"] == "output_text":
-                            output_text += content_item["text"]
-
-                results[custom_id] = output_text
-
-            except Exception as e:
-                results[custom_id] = None
+        with self.client.files.with_streaming_response.content(output_file_id) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                custom_id = record["custom_id"]
+
+                # Extract item index from custom_id
+                try:
+                    output_text = ""
+                    for item in record["response"]["body"]["output"]:
+                        for content_item in item["content"]:
+                            if content_item["type"] == "output_text":
+                                output_text += content_item["text"]
+
+                    results[custom_id] = output_text
+
+                except Exception as e:
+                    results[custom_id] = None
 
         return results
 
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    An asyncio token bucket: it holds up to capacity tokens, refilled continuously at a fixed rate,
+    and acquiring tokens waits until enough of them are available.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        """
+        Creates a TokenBucket, initially full
+
+        :param rate_per_minute: the number of tokens added per minute
+        :param capacity: the maximum number of tokens held, None for rate_per_minute
+        """
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Waits until the bucket holds enough tokens, then takes them
+
+        :param amount: the number of tokens to take (capped to the capacity of the bucket)
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    Limits the requests sent to an API by requests per minute and tokens per minute,
+    with a token bucket for each limit.
+    """
+
+    def __init__(self, requests_per_minute: float | None = None, tokens_per_minute: float | None = None):
+        """
+        Creates a RateLimiter
+
+        :param requests_per_minute: the maximum number of requests per minute, None for no limit
+        :param tokens_per_minute: the maximum number of tokens per minute, None for no limit
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, n_tokens: int = 0) -> None:
+        """
+        Waits until a request of the given number of tokens can be sent
+
+        :param n_tokens: the (estimated) number of tokens of the request
+        """
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None and n_tokens > 0:
+            await self.tokens.acquire(n_tokens)
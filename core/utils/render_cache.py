@@ -0,0 +1,114 @@
+import hashlib
+from collections import OrderedDict
+from typing import TypeVar, Generic, Callable, Sequence
+
+from core.utils.disk_cache import DiskCache
+
+T = TypeVar('T')
+
+
+class RenderCache(Generic[T]):
+    """
+    A content-addressed cache of the prompt-ready text of pydantic items (e.g. game states).
+    Items are keyed by a hash of their canonical JSON serialization, so equal items are rendered only once,
+    across runs too when the cache is persisted on disk.
+    Hashing an item costs about as much as rendering it, so the items of a dataset can also be rendered by index:
+    their texts are then memoized by index, and the content hash is only computed the first time an index is seen.
+    """
+
+    def __init__(
+            self,
+            render: Callable[[T], str],
+            path: str | None = None,
+            max_memory_items: int = 100_000,
+            render_many: Callable[[list[T]], list[str]] | None = None,
+    ):
+        """
+        Creates a RenderCache
+
+        :param render: the function that renders an item
+        :param path: the path of the SQLite database storing the rendered texts, None to only cache in memory
+        :param max_memory_items: the maximum number of rendered texts kept in memory
+        :param render_many: the (optional) function that renders many items at once, equivalent to render
+        """
+        self.render_one = render
+        self.render_batch = render_many
+        self.cache = DiskCache(path, max_memory_items)
+        self.max_memory_items = max_memory_items
+        self.memo: OrderedDict[int, str] = OrderedDict()
+
+    @staticmethod
+    def key(item: T) -> str:
+        """
+        Computes the content hash of an item
+
+        :param item: the item
+        :return: the hex digest of its canonical JSON serialization
+        """
+        return hashlib.blake2b(item.model_dump_json().encode('utf-8'), digest_size=16).hexdigest()
+
+    def render(self, item: T) -> str:
+        """
+        Renders an item, reading the text from the cache when available
+
+        :param item: the item
+        :return: the rendered text
+        """
+        return self.render_many([item])[0]
+
+    def render_at(self, dataset: Sequence[T], indices: Sequence[int]) -> list[str]:
+        """
+        Renders the items of a dataset at some indices. The texts are memoized by index, so an item is
+        only fetched, hashed and looked up (or rendered) the first time its index is seen:
+        the cache must only be used with one dataset through this method.
+
+        :param dataset: the dataset
+        :param indices: the indices of the items
+        :return: the rendered text of each item
+        """
+        texts = [self.memo.get(idx) for idx in indices]
+        missing = [position for position, text in enumerate(texts) if text is None]
+        if missing:
+            rendered = self.render_many([dataset[indices[position]] for position in missing])
+            for position, text in zip(missing, rendered):
+                texts[position] = text
+                self.memo[indices[position]] = text
+            while len(self.memo) > self.max_memory_items:
+                self.memo.popitem(last=False)
+        return texts
+
+    def render_many(self, items: Sequence[T]) -> list[str]:
+        """
+        Renders many items, only rendering (and storing) the ones that are not cached
+
+        :param items: the items
+        :return: the rendered text of each item
+        """
+        keys = [self.key(item) for item in items]
+        cached = self.cache.get_many(keys)
+
+        missing = dict()
+        for item, key in zip(items, keys):
+            if cached[key] is None and key not in missing:
+                missing[key] = item
+
+        if missing:
+            if self.render_batch is not None:
+                texts = self.render_batch(list(missing.values()))
+            else:
+                texts = [self.render_one(item) for item in missing.values()]
+            rendered = dict(zip(missing, texts))
+            self.cache.put_many(rendered)
+            cached.update(rendered)
+
+        return [cached[key] for key in keys]
+
+    def deduplicate(self, items: Sequence[T]) -> list[int]:
+        """
+        Detects the items that render to identical text
+
+        :param items: the items
+        :return: for each item, the index of the first item with the same rendered text
+        """
+        first_seen = dict()
+        return [first_seen.setdefault(text, i) for i, text in enumerate(self.render_many(items))]
@@ -0,0 +1,78 @@
+import hashlib
+import json
+from typing import Any, Iterable
+
+from core.utils.disk_cache import DiskCache
+
+
+class ResponseCache:
+    """
+    A content-addressed cache of the outputs of LLM requests, keyed by a hash of the request:
+    re-running a job only pays for the requests whose (model, system prompt, user content, parameters)
+    were never answered before.
+    Requests are described by an envelope shared by many of them (model, parameters and system prompt)
+    and the content of each one, so the envelope is hashed once for all the requests.
+    """
+
+    def __init__(self, path: str | None = None, max_disk_bytes: int | None = None, max_memory_items: int = 100_000):
+        """
+        Creates a ResponseCache
+
+        :param path: the path of the SQLite database storing the outputs, None to only cache in memory
+        :param max_disk_bytes: the maximum size of the database, None for no limit
+        :param max_memory_items: the maximum number of outputs kept in memory
+        """
+        self.cache = DiskCache(path, max_memory_items, max_disk_bytes)
+
+    @staticmethod
+    def envelope(**params: Any) -> str:
+        """
+        Serializes the part of the requests shared by many of them
+
+        :param params: the shared parameters (e.g. model, system prompt, max output tokens)
+        :return: the canonical JSON serialization of the parameters
+        """
+        return json.dumps(params, sort_keys=True)
+
+    @staticmethod
+    def keys(envelope: str, contents: Iterable[str]) -> list[str]:
+        """
+        Computes the keys of requests sharing an envelope
+
+        :param envelope: the serialized envelope of the requests
+        :param contents: the content of each request
+        :return: the key of each request
+        """
+        base = hashlib.blake2b(envelope.encode('utf-8'), digest_size=16)
+        base.update(b"\x00")
+        keys = list()
+        for content in contents:
+            digest = base.copy()
+            digest.update(content.encode('utf-8'))
+            keys.append(digest.hexdigest())
+        return keys
+
+    def get_many(self, keys: list[str]) -> dict[str, str | None]:
+        """
+        Looks up the outputs of many requests
+
+        :param keys: the keys of the requests
+        :return: the cached output of each request, None for the ones that are not cached
+        """
+        return self.cache.get_many(keys)
+
+    def put_many(self, outputs: dict[str, str]) -> None:
+        """
+        Stores the outputs of many requests
+
+        :param outputs: the outputs, by request key
+        """
+        self.cache.put_many(outputs)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit, miss and eviction counts of the cache, and the size of its database
+
+        :return: a dictionary with the statistics
+        """
+        return self.cache.stats()
@@ -0,0 +1,112 @@
+import math
+from typing import Sequence
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+class TokenCounter:
+    """
+    Counts the tokens of prompts sent to an OpenAI model.
+    Uses the tokenizer of the model when tiktoken is installed, and otherwise estimates counts
+    from the number of characters, with a chars-per-token ratio that can be calibrated against
+    the token usage reported by the API.
+    Counts of constant texts (e.g. system prompts) are cached.
+
+    :ivar float chars_per_token: the ratio used when no tokenizer is available
+    :ivar int overhead_per_message: the tokens added by the API to each message of a request
+    """
+
+    def __init__(self, model: str, chars_per_token: float = 3.0, overhead_per_message: int = 4):
+        """
+        Creates a TokenCounter
+
+        :param model: the name of the model
+        :param chars_per_token: the chars-per-token ratio used when no tokenizer is available
+        :param overhead_per_message: the tokens added by the API to each message of a request
+        """
+        self.model = model
+        self.chars_per_token = chars_per_token
+        self.overhead_per_message = overhead_per_message
+        self.constant_counts: dict[str, int] = dict()
+
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+
+    def count(self, text: str) -> int:
+        """
+        Counts the tokens of a text
+
+        :param text: the text
+        :return: the number of tokens
+        """
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_many(self, texts: Sequence[str]) -> list[int]:
+        """
+        Counts the tokens of many texts at once
+
+        :param texts: the texts
+        :return: the number of tokens of each text
+        """
+        if self.encoding is not None:
+            return [len(tokens) for tokens in self.encoding.encode_batch(list(texts), disallowed_special=())]
+        return [math.ceil(len(text) / self.chars_per_token) for text in texts]
+
+    def count_constant(self, text: str) -> int:
+        """
+        Counts the tokens of a text that is part of many requests, counting it only once
+
+        :param text: the text
+        :return: the number of tokens
+        """
+        if text not in self.constant_counts:
+            self.constant_counts[text] = self.count(text)
+        return self.constant_counts[text]
+
+    def count_requests(self, system_prompt: str, user_contents: Sequence[str]) -> list[int]:
+        """
+        Counts the input tokens of requests made of a shared system prompt and a user message
+
+        :param system_prompt: the system prompt shared by the requests
+        :param user_contents: the user message of each request
+        :return: the number of input tokens of each request
+        """
+        constant = self.count_constant(system_prompt) + 2 * self.overhead_per_message
+        return [constant + n_tokens for n_tokens in self.count_many(user_contents)]
+
+    def calibrate(self, texts: Sequence[str], n_tokens: Sequence[int]) -> None:
+        """
+        Fits the chars-per-token ratio to the token counts reported by the API for some texts.
+        Has no effect on the counts when a tokenizer is available.
+
+        :param texts: the texts
+        :param n_tokens: the number of tokens of each text, as reported by the API
+        """
+        total_tokens = sum(n_tokens)
+        if total_tokens > 0:
+            self.chars_per_token = sum(len(text) for text in texts) / total_tokens
+            self.constant_counts.clear()
+
+    def calibrate_requests(self, system_prompt: str, user_contents: Sequence[str], input_tokens: Sequence[int]) -> None:
+        """
+        Fits the chars-per-token ratio to the input tokens reported by the API (e.g. in the usage of batch outputs)
+        for requests made of a shared system prompt and a user message.
+        Has no effect on the counts when a tokenizer is available.
+
+        :param system_prompt: the system prompt shared by the requests
+        :param user_contents: the user message of each request
+        :param input_tokens: the number of input tokens of each request, as reported by the API
+        """
+        total_tokens = sum(input_tokens) - 2 * self.overhead_per_message * len(input_tokens)
+        if total_tokens > 0:
+            self.chars_per_token = (len(system_prompt) * len(user_contents) + sum(map(len, user_contents))) / total_tokens
+            self.constant_counts.clear()
@@ -1,15 +1,28 @@
-import dataclasses
+import hashlib
 import json
-import math
+import os
 import time
+from typing import Any, Callable, Iterable, Iterator
 
+import numpy as np
 from openai import OpenAI
 from dataclasses import dataclass
 
 from core.datasets import GamePalsDataset
+from core.knowledge.batch_manifest import BatchManifest
+from core.knowledge.batch_scheduler import BatchScheduler, BatchShard
+from core.knowledge.batch_writer import BatchRequestWriter
 from core.knowledge.gamepals_teacher import GamePalsTeacher
+from core.knowledge.teacher_output_parser import TeacherOutputParser
+from core.knowledge.teacher_requests import TeacherRequests
+from core.knowledge.user_command_batch import UserCommandBatch
+from core.knowledge.user_command_writer import UserCommandWriter
 from core.knowledge.utils import UserCommandInfo
+from core.utils.render_cache import RenderCache
+from core.utils.response_cache import ResponseCache
+from core.utils.token_counter import TokenCounter
 from doom.utils.doom_game_state import DoomGameState
+from doom.utils.doom_game_state_renderer import DoomGameStateRenderer
 
 
 @dataclass
@@ -20,84 +33,494 @@ class DoomTeacherOptions:
     :ivar str prompt_data_filepath: the path to the file containing doom-specific parts of the prompt
     :ivar str open_ai_model: the name of the model to use as teacher
     :ivar str user_commands_batch_input_filepath: the path for batch input files
-    :ivar str user_commands_batch_output_filepath: the path for batch output files
-    :ivar int max_tokens_per_batch: maximum tokens to enqueue per batch
-    :ivar int estimated_tokens_per_request: estimated tokens per request for chunking
+    :ivar str user_commands_batch_output_filepath: the path of the columnar store of the generated user commands
+    :ivar int max_tokens_per_batch: maximum tokens enqueued at once by the in-flight batches
+    :ivar str | None render_cache_filepath: the path of the cache of rendered game states, None to only cache in memory
+    :ivar int n_render_workers: the number of worker processes rendering game states for the batch files
+    :ivar int | None max_tokens_per_shard: maximum tokens of a single batch, None for a quarter of max_tokens_per_batch
+        (so that several batches are in flight at once)
+    :ivar str | None manifest_filepath: the path of the job manifest, None for the batch input path + ".manifest.json"
+    :ivar int max_batch_retries: maximum number of times the failed requests of a batch are retried
+    :ivar float chars_per_token: the chars-per-token ratio used to count tokens when no tokenizer is installed
+    :ivar str | None response_cache_filepath: the path of the cache of teacher outputs, None to disable it
+    :ivar int | None response_cache_max_bytes: the maximum size of the cache of teacher outputs, None for no limit
+    :ivar float min_poll_interval: the polling interval (in seconds) of the batches after one made progress
+    :ivar float max_poll_interval: the maximum polling interval (in seconds) of the batches
+    :ivar str | None labels_batch_input_filepath: the path for labeling batch input files,
+        None for the user commands batch input path + ".labels"
+    :ivar str | None labels_output_filepath: the path of the JSONL file of the generated labels,
+        None for the user commands output path + ".labels.jsonl"
     """
     prompt_data_filepath: str
     open_ai_model: str
     user_commands_batch_input_filepath: str
     user_commands_batch_output_filepath: str
     max_tokens_per_batch: int
-    estimated_tokens_per_request: int
+    render_cache_filepath: str | None = None
+    n_render_workers: int = 1
+    max_tokens_per_shard: int | None = None
+    manifest_filepath: str | None = None
+    max_batch_retries: int = 2
+    chars_per_token: float = 3.0
+    response_cache_filepath: str | None = None
+    response_cache_max_bytes: int | None = None
+    min_poll_interval: float = 5.0
+    max_poll_interval: float = 60.0
+    labels_batch_input_filepath: str | None = None
+    labels_output_filepath: str | None = None
 
 class DoomTeacher(GamePalsTeacher):
     """
     DoomTeacher is a Doom-specific implementation for a Knowledge Distillation Teacher.
     """
 
-    def __init__(self, game_states: GamePalsDataset[DoomGameState], options: DoomTeacherOptions):
+    def __init__(
+            self,
+            game_states: GamePalsDataset[DoomGameState],
+            options: DoomTeacherOptions,
+            client: Any | None = None
+    ):
         """
         Creates a DoomTeacher.
 
         :param game_states: the dataset of game states from which the teacher should elicit their knowledge
         :param DoomTeacherOptions options: the options for the instantiation of the teacher
+        :param client: the client of the LLM API (any object exposing the files and batches APIs of the OpenAI one,
+            e.g. a FakeOpenAI to run offline), None for an OpenAI client
         """
         super().__init__(game_states)
         self.options = options
-        self.client = OpenAI()
+        self.client = client if client is not None else OpenAI()
+        self.renderer = DoomGameStateRenderer(n_workers=options.n_render_workers)
+        self.render_cache = RenderCache(
+            render=DoomGameState.to_prompt_ready,
+            path=options.render_cache_filepath,
+            render_many=self.renderer.render_parallel,
+        )
+        self.token_counter = TokenCounter(options.open_ai_model, chars_per_token=options.chars_per_token)
+        self.response_cache = None
+        if options.response_cache_filepath is not None:
+            self.response_cache = ResponseCache(options.response_cache_filepath, options.response_cache_max_bytes)
 
     def generate_user_commands(self, prompt: str):
         """
         Generates user commands for the dataset of game states,
         using the OpenAI API to access a state-of-the-art black-box LLM.
         Splits into multiple batches if needed to stay under token limits.
+        The batches are recorded in a job manifest: if a previous run was interrupted, its completed batches
+        are only downloaded, its running batches are re-attached and only the batches that never started are submitted.
+        Malformed outputs are quarantined next to the output file and their requests are retried, like the failed
+        requests; the ones still failed or malformed after the last retry are listed in a retry file
+        (output path + ".retry.json").
+        Commands are only written to the output store while the batches run: once they all ended,
+        self.user_commands is the (memory-mapped) UserCommandBatch of the store.
 
         :param prompt: the knowledge-elicitation prompt
         """
-        # Calculate how many batches we need
-        requests_per_batch = self.options.max_tokens_per_batch // self.options.estimated_tokens_per_request
-        num_batches = math.ceil(len(self.game_states) / requests_per_batch)
+        requests = self.user_command_requests(prompt)
+        manifest = BatchManifest(
+            self.options.manifest_filepath or f"{self.options.user_commands_batch_input_filepath}.manifest.json"
+        )
 
-        print(f"Total game states: {len(self.game_states)}")
-        print(f"Splitting into {num_batches} batch(es) with ~{requests_per_batch} requests each")
+        output_path = self.options.user_commands_batch_output_filepath
+        quarantine_path = f"{output_path}.quarantine.jsonl"
+        with TeacherOutputParser(UserCommandInfo, quarantine_path) as parser, UserCommandWriter(output_path) as writer:
+            retry_ids = self.run_requests(
+                requests,
+                manifest,
+                plan=lambda: self.plan_user_command_shards(prompt),
+                load=self.user_command_loader(writer, parser),
+            )
+        self.user_commands = UserCommandBatch.load(output_path)
+
+        with open(f"{output_path}.retry.json", "w", encoding="utf-8") as f:
+            json.dump(retry_ids, f)
+
+        print(f"\nTotal user commands generated: {writer.count}")
+        print(f"Malformed outputs quarantined: {parser.n_quarantined} ({len(retry_ids)} left to retry)")
+        if self.response_cache is not None:
+            print(f"Response cache: {self.response_cache.stats()}")
 
-        all_batch_ids = []
+    def generate_labels(self, prompt: str):
+        """
+        Generates a label for each user command of the output store of generate_user_commands,
+        with one request per command, run through the same batch pipeline as the user commands
+        (job manifest, concurrent batches, retries and response cache).
+        Commands are grouped by game state: each game state is rendered once for all its commands,
+        and the requests of a game state are consecutive, so they share the prefix of their prompt.
+        Labels are appended to a JSONL file as each batch ends, one record per label keyed by
+        game state index and command index (the position of the command among the ones of its game state).
+        Failed requests and empty outputs are retried; the ones still failed or empty after the last retry
+        are listed in a retry file (labels output path + ".retry.json"). self.labels is aligned with the command store (None for unlabeled commands).
+
+        :param prompt: the labeling prompt
+        """
+        commands = UserCommandBatch.load(self.options.user_commands_batch_output_filepath)
+        state_indices, offsets, order = commands.group_by_state()
+
+        # Requests are indexed by the position of their command in the grouped order
+        command_states = commands.columns['game_state_idx'][order]
+        command_indices = np.arange(len(commands)) - np.repeat(offsets[:-1], np.diff(offsets))
+        command_texts = commands.decode('command')[order]
+        print(f"Total user commands: {len(commands)} (for {len(state_indices)} game states)")
+
+        def render(positions: list[int]) -> list[str]:
+            states, inverse = np.unique(command_states[positions], return_inverse=True)
+            rendered = self.render_game_states(states.tolist())
+            return [
+                self.label_user_content(rendered[state], command_texts[position])
+                for state, position in zip(inverse, positions)
+            ]
+
+        input_path = self.options.labels_batch_input_filepath or f"{self.options.user_commands_batch_input_filepath}.labels"
+        output_path = self.options.labels_output_filepath or f"{self.options.user_commands_batch_output_filepath}.labels.jsonl"
+        requests = TeacherRequests(
+            system_prompt=self.build_full_prompt(prompt),
+            render=render,
+            input_filepath=input_path,
+            id_prefix="label-",
+            n_items=len(commands),
+        )
+        manifest = BatchManifest(f"{input_path}.manifest.json")
 
-        # Process batches sequentially: submit, wait for completion, then submit next
-        for batch_num in range(num_batches):
-            start_idx = batch_num * requests_per_batch
-            end_idx = min((batch_num + 1) * requests_per_batch, len(self.game_states))
+        self.labels = [None] * len(commands)
+        with open(output_path, "w", encoding="utf-8") as f:
+            def load(custom_id: str, output_text: str) -> bool:
+                if not output_text:
+                    return False
+                position = requests.item_of(custom_id)
+                self.labels[order[position]] = output_text
+                f.write(json.dumps({
+                    "game_state_idx": int(command_states[position]),
+                    "command_idx": int(command_indices[position]),
+                    "label": output_text,
+                }) + "\n")
+                return True
+
+            retry_ids = self.run_requests(
+                requests,
+                manifest,
+                plan=lambda: self.plan_shards(requests, list(range(len(commands)))),
+                load=load,
+            )
+
+        with open(f"{output_path}.retry.json", "w", encoding="utf-8") as f:
+            json.dump(retry_ids, f)
+
+        print(f"\nTotal labels generated: {sum(label is not None for label in self.labels)}/{len(commands)}")
+        if self.response_cache is not None:
+            print(f"Response cache: {self.response_cache.stats()}")
+
+    @staticmethod
+    def label_user_content(rendered_game_state: str, command: str) -> str:
+        """
+        Builds the user content of the labeling request of a user command.
+        The game state comes first, so that the requests of the commands of a game state share their prefix.
 
-            batch_file = f"{self.options.user_commands_batch_input_filepath}.{batch_num}"
+        :param rendered_game_state: the prompt-ready text of the game state
+        :param command: the user command
+        :return: the user content
+        """
+        return f"{rendered_game_state}\n\nUSER COMMAND: {command}"
 
-            print(f"\n=== Batch {batch_num + 1}/{num_batches} ===")
-            print(f"Processing game states {start_idx} to {end_idx - 1}")
-            print("Building batch file...")
+    def user_command_requests(self, prompt: str) -> TeacherRequests:
+        """
+        Describes the user command generation requests, one per game state
 
-            self.build_batch_jsonl(prompt, batch_file, start_idx, end_idx)
+        :param prompt: the knowledge-elicitation prompt
+        :return: the requests
+        """
+        return TeacherRequests(
+            system_prompt=self.build_full_prompt(prompt),
+            render=self.render_game_states,
+            input_filepath=self.options.user_commands_batch_input_filepath,
+            id_prefix="state-",
+            n_items=len(self.game_states),
+        )
 
-            print("Submitting batch...")
-            batch_id = self.submit_batch(batch_file)
-            all_batch_ids.append(batch_id)
+    def run_requests(
+            self,
+            requests: TeacherRequests,
+            manifest: BatchManifest,
+            plan: Callable[[], list[BatchShard]],
+            load: Callable[[str, str], bool]
+    ) -> list[str]:
+        """
+        Runs requests as batches recorded in a job manifest, loading their outputs as soon as each batch ends.
+        If the manifest already has shards for the same requests (same fingerprint, and no submitted request file
+        changed since), the job is resumed: the outputs of the ended batches are loaded again,
+        the running batches are re-attached and the failed ones are submitted again.
+        Otherwise, a fresh job is planned.
+        The failed requests and the invalid outputs are retried, up to max_batch_retries times.
+
+        :param requests: the requests
+        :param manifest: the job manifest
+        :param plan: the function splitting the requests into shards, called if the manifest has none
+        :param load: the function loading an output, given its custom_id and text, returning whether it is valid
+        :return: the custom_ids of the requests still failed, or with an invalid output, after the last retry
+        """
+        fingerprint = self.job_fingerprint(requests)
+        if manifest.shards and manifest.fingerprint != fingerprint:
+            print(f"The requests of {manifest.path} changed, starting a fresh job")
+            manifest.shards = list()
+        elif manifest.shards and manifest.changed_shards():
+            print(f"The request files of {manifest.path} changed since they were submitted, starting a fresh job")
+            manifest.shards = list()
+
+        if manifest.shards:
+            print(f"Resuming the {len(manifest.shards)} batch(es) of {manifest.path}")
+            for shard in manifest.shards:
+                if shard.status in ("failed", "cancelled", "expired"):
+                    shard.file_id, shard.batch_id, shard.status = None, None, "pending"
+        else:
+            manifest.shards = plan()
+            manifest.fingerprint = fingerprint
+            manifest.save()
+
+        invalid = dict()
+
+        # Outputs are loaded as soon as each batch ends, while the other batches still run
+        def on_end(shard: BatchShard, batch=None) -> None:
+            if shard.status == "completed":
+                print(f"Loading results from batch {shard.batch_id}")
+                usage = list()
+                results = self.iter_batch_results(shard.output_file_id, usage)
+                invalid[shard.input_path] = self.load_results(requests, results, load)
+                self.calibrate_token_counter(requests, usage)
+            elif shard.status == "cached":
+                print(f"Loading {len(shard.item_indices)} cached result(s)")
+                results = self.iter_cached_results(requests, shard.item_indices)
+                invalid[shard.input_path] = self.load_results(requests, results, load, cache=False)
+
+        for shard in manifest.shards:
+            on_end(shard)
+
+        for attempt in range(self.options.max_batch_retries + 1):
+            self.run_shards(requests, manifest, on_end=on_end)
+            if attempt == self.options.max_batch_retries or not self.add_retry_shards(requests, manifest, invalid):
+                break
+
+        for shard in manifest.shards:
+            if shard.status not in ("completed", "cached"):
+                raise RuntimeError(f"Batch {shard.batch_id} failed with status: {shard.status}")
+
+        # The requests of the shards without a retry that failed or whose output was invalid are left to retry
+        retry_ids = list()
+        for shard in manifest.shards:
+            if manifest.retries_of(shard):
+                continue
+            if shard.n_failed > 0:
+                retry_ids.extend(self.load_failed_custom_ids(shard))
+            retry_ids.extend(invalid.get(shard.input_path, []))
+        return retry_ids
+
+    def plan_user_command_shards(self, prompt: str) -> list[BatchShard]:
+        """
+        Splits the game states with distinct prompts into shards, each run as a single batch.
 
-            print(f"Batch submitted: {batch_id}")
+        :param prompt: the knowledge-elicitation prompt
+        :return: the shards
+        """
+        # Only send one request per distinct rendered game state
+        state_indices = self.unique_state_indices()
+        print(f"Total game states: {len(self.game_states)} ({len(state_indices)} with distinct prompts)")
+        return self.plan_shards(self.user_command_requests(prompt), state_indices)
 
-            # Wait for THIS batch to complete before submitting the next one
-            print(f"Waiting for batch {batch_num + 1}/{num_batches} to complete...")
-            status = self.wait_for_batch(batch_id)
+    def plan_shards(self, requests: TeacherRequests, indices: list[int]) -> list[BatchShard]:
+        """
+        Splits the requests of some items into shards, each run as a single batch.
+        Shards are packed greedily with requests, up to the maximum number of tokens of a batch.
+        The requests already answered in the response cache (if enabled) go into a "cached" shard, never submitted.
 
-            if status != "completed":
-                raise RuntimeError(f"Batch {batch_id} failed with status: {status}")
+        :param requests: the requests
+        :param indices: the indices of the items
+        :return: the shards
+        """
+        shards = list()
+
+        if self.response_cache is not None:
+            cached_indices = list()
+            keys = self.response_keys(requests, indices)
+            for start in range(0, len(keys), 10_000):
+                cached = self.response_cache.get_many(keys[start:start + 10_000])
+                cached_indices.extend(
+                    idx for idx, key in zip(indices[start:start + 10_000], keys[start:start + 10_000])
+                    if cached[key] is not None
+                )
+            print(f"Response cache: {len(cached_indices)} of {len(indices)} request(s) already answered")
+            if cached_indices:
+                shards.append(BatchShard(
+                    input_path=f"{requests.input_filepath}.cached",
+                    n_tokens=0,
+                    item_indices=cached_indices,
+                    status="cached",
+                ))
+                cached_set = set(cached_indices)
+                indices = [idx for idx in indices if idx not in cached_set]
+
+        n_tokens = self.count_request_tokens(requests, indices)
+
+        tokens_per_shard = self.options.max_tokens_per_shard or max(self.options.max_tokens_per_batch // 4, 1)
+        ranges = BatchScheduler.pack(n_tokens, tokens_per_shard)
+
+        print(f"Total input tokens: {sum(n_tokens)} for {len(indices)} request(s), split into {len(ranges)} batch(es) "
+              f"of up to {tokens_per_shard} tokens each")
+
+        return shards + [
+            BatchShard(
+                input_path=f"{requests.input_filepath}.{batch_num}",
+                n_tokens=sum(n_tokens[positions.start:positions.stop]),
+                item_indices=indices[positions.start:positions.stop],
+            )
+            for batch_num, positions in enumerate(ranges)
+        ]
+
+    def job_fingerprint(self, requests: TeacherRequests, chunk_size: int = 10_000) -> str:
+        """
+        Computes the fingerprint of a job: a hash of the model, the system prompt and the ordered user contents
+        of the requests of all the items
 
-            print(f"Batch {batch_num + 1}/{num_batches} completed successfully!")
+        :param requests: the requests
+        :param chunk_size: the number of items rendered at once
+        :return: the hex digest of the requests
+        """
+        digest = hashlib.blake2b(self.batch_request_writer(requests).envelope.encode("utf-8"), digest_size=16)
+        digest.update(requests.id_prefix.encode("utf-8"))
+        for start in range(0, requests.n_items, chunk_size):
+            for content in requests.render(list(range(start, min(start + chunk_size, requests.n_items)))):
+                digest.update(b"\x00")
+                digest.update(content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def response_keys(self, requests: TeacherRequests, indices: list[int], chunk_size: int = 10_000) -> list[str]:
+        """
+        Computes the response cache keys of the requests of some items
 
-        # Load results from all batches
-        print("\n=== Loading results from all batches ===")
-        self.load_multiple_batch_results(all_batch_ids)
+        :param requests: the requests
+        :param indices: the indices of the items
+        :param chunk_size: the number of items rendered at once
+        :return: the key of the request of each item
+        """
+        envelope = self.batch_request_writer(requests).envelope
+        keys = list()
+        for start in range(0, len(indices), chunk_size):
+            keys.extend(ResponseCache.keys(envelope, requests.render(indices[start:start + chunk_size])))
+        return keys
+
+    def iter_cached_results(
+            self,
+            requests: TeacherRequests,
+            indices: list[int],
+            chunk_size: int = 10_000
+    ) -> Iterator[tuple[str, str]]:
+        """
+        Stream the cached outputs of the requests of some items
 
-    def generate_labels(self, prompt: str):
-        pass
+        :param requests: the requests
+        :param indices: the indices of the items
+        :param chunk_size: the number of outputs looked up at once
+        :return: an iterator of the custom_id and output text of each request
+        """
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            keys = self.response_keys(requests, chunk)
+            cached = self.response_cache.get_many(keys)
+            for idx, key in zip(chunk, keys):
+                # An output evicted since planning is invalid, so its request is retried
+                yield requests.custom_id(idx), cached[key] or ""
+
+    def count_request_tokens(self, requests: TeacherRequests, indices: list[int], chunk_size: int = 10_000) -> list[int]:
+        """
+        Counts the input tokens of the requests of some items (full prompt and user content)
+
+        :param requests: the requests
+        :param indices: the indices of the items
+        :param chunk_size: the number of items rendered at once
+        :return: the number of input tokens of the request of each item
+        """
+        n_tokens = list()
+        for start in range(0, len(indices), chunk_size):
+            user_contents = requests.render(indices[start:start + chunk_size])
+            n_tokens.extend(self.token_counter.count_requests(requests.system_prompt, user_contents))
+        return n_tokens
+
+    def run_shards(
+            self,
+            requests: TeacherRequests,
+            manifest: BatchManifest,
+            on_end: Callable[[BatchShard, Any], None] | None = None
+    ) -> None:
+        """
+        Runs the shards of a manifest until all their batches end, keeping the manifest up to date.
+        Request files are only (re)built for the shards that were never submitted and whose file is missing or changed.
+
+        :param requests: the requests of the shards
+        :param manifest: the job manifest
+        :param on_end: the (optional) function called with each shard and its final batch object, as soon as it ends
+        """
+        to_build = [
+            shard for shard in manifest.shards
+            if shard.batch_id is None and shard.status == "pending" and (
+                shard.input_hash is None
+                or not os.path.exists(shard.input_path)
+                or BatchManifest.hash_file(shard.input_path) != shard.input_hash
+            )
+        ]
+        if to_build:
+            print(f"Building {len(to_build)} batch file(s)...")
+            self.build_batch_files(requests, [(shard.input_path, shard.item_indices) for shard in to_build])
+            for shard in to_build:
+                shard.input_hash = BatchManifest.hash_file(shard.input_path)
+            manifest.save()
+
+        # Keep as many batches in flight as the enqueued-token budget allows
+        print(f"Running batches with up to {self.options.max_tokens_per_batch} tokens enqueued")
+        for shard in manifest.shards:
+            print(f"{shard.input_path}: {len(shard.item_indices)} requests, {shard.n_tokens} input tokens ({shard.status})")
+        scheduler = BatchScheduler(
+            self.client,
+            max_enqueued_tokens=self.options.max_tokens_per_batch,
+            min_poll_interval=self.options.min_poll_interval,
+            max_poll_interval=self.options.max_poll_interval,
+        )
+        scheduler.run(manifest.shards, on_end=on_end, on_change=lambda shard: manifest.save())
+        manifest.save()
+
+    def add_retry_shards(
+            self,
+            requests: TeacherRequests,
+            manifest: BatchManifest,
+            invalid: dict[str, list[str]] | None = None
+    ) -> list[BatchShard]:
+        """
+        Adds to a manifest a retry shard for each completed batch with failed requests (and no retry shard yet),
+        containing only the items of the failed requests
+
+        :param requests: the requests of the shards
+        :param manifest: the job manifest
+        :param invalid: the custom_ids of the invalid outputs of each shard (by input path), retried as well
+        :return: the new retry shards
+        """
+        invalid = invalid or dict()
+        retries = list()
+        for shard in list(manifest.shards):
+            invalid_ids = invalid.get(shard.input_path, [])
+            if shard.status not in ("completed", "cached") or (shard.n_failed == 0 and not invalid_ids) or manifest.retries_of(shard):
+                continue
+            failed_ids = self.load_failed_custom_ids(shard) if shard.n_failed > 0 else []
+            indices = [requests.item_of(custom_id) for custom_id in failed_ids + invalid_ids]
+            if not indices:
+                continue
+            print(f"Retrying {len(indices)} failed request(s) of batch {shard.batch_id}")
+            retries.append(BatchShard(
+                input_path=f"{shard.input_path}.retry",
+                n_tokens=sum(self.count_request_tokens(requests, indices)),
+                item_indices=indices,
+                retry_of=shard.input_path,
+            ))
+        manifest.shards.extend(retries)
+        manifest.save()
+        return retries
 
     def build_full_prompt(self, base_prompt: str) -> str:
         prompt_data = json.load(open(self.options.prompt_data_filepath, "r"))
@@ -110,7 +533,36 @@ class DoomTeacher(GamePalsTeacher):
 
         return full_prompt
 
-    def build_batch_jsonl(self, base_prompt: str, output_path: str, start_idx: int = 0, end_idx: int = None) -> None:
+    def render_game_states(self, indices: list[int]) -> list[str]:
+        """
+        Renders game states into their prompt-ready text, through the render cache.
+        Every stage that prompts game states (batch building, labeling, student data export) should read from here.
+        Texts are memoized by game state index, so each game state is hashed (and rendered) at most once per run.
+
+        :param indices: the indices of the game states
+        :return: the prompt-ready text of each game state
+        """
+        return self.render_cache.render_at(self.game_states, indices)
+
+    def unique_state_indices(self) -> list[int]:
+        """
+        Finds the game states whose rendered prompt is not identical to the one of a previous game state
+        (e.g. perturbations that did not change anything visible to the teacher)
+
+        :return: the indices of the first game state of each distinct prompt
+        """
+        first_seen = dict()
+        texts = self.render_game_states(list(range(len(self.game_states))))
+        return [idx for idx, text in enumerate(texts) if first_seen.setdefault(text, idx) == idx]
+
+    def build_batch_jsonl(
+            self,
+            base_prompt: str,
+            output_path: str,
+            start_idx: int = 0,
+            end_idx: int = None,
+            indices: list[int] | None = None
+    ) -> None:
         """
         Build a batch JSONL file for a subset of game states.
 
@@ -118,37 +570,35 @@ class DoomTeacher(GamePalsTeacher):
         :param output_path: where to save the JSONL file
         :param start_idx: starting index in game_states (inclusive)
         :param end_idx: ending index in game_states (exclusive), None for all
+        :param indices: the indices of the game states to include, instead of the start_idx:end_idx range
         """
-        full_prompt = self.build_full_prompt(base_prompt)
-
         if end_idx is None:
             end_idx = len(self.game_states)
+        if indices is None:
+            indices = list(range(start_idx, end_idx))
 
-        with open(output_path, "w", encoding="utf-8") as f:
-            for idx in range(start_idx, end_idx):
-                game_state = self.game_states[idx]
-                request = {
-                    "custom_id": f"state-{idx}",
-                    "method": "POST",
-                    "url": "/v1/responses",
-                    "body": {
-                        "model": self.options.open_ai_model,
-                        "max_output_tokens": 256,
-                        "temperature": 1.0, # TODO: verify if ignored or used
-                        "input": [
-                            {
-                                "role": "system",
-                                "content": full_prompt
-                            },
-                            {
-                                "role": "user",
-                                "content": game_state.to_prompt_ready()
-                            }
-                        ]
-                    }
-                }
-
-                f.write(json.dumps(request) + "\n")
+        self.build_batch_files(self.user_command_requests(base_prompt), [(output_path, indices)])
+
+    def build_batch_files(self, requests: TeacherRequests, shards: list[tuple[str, list[int]]]) -> None:
+        """
+        Build the batch JSONL files of many shards of requests, in a single streaming pass.
+        The request envelope and the full prompt are serialized once, and the user contents are rendered
+        (e.g. in the worker processes of the renderer) a chunk at a time.
+
+        :param requests: the requests
+        :param shards: the output path and the item indices of each batch file
+        """
+        writer = self.batch_request_writer(requests)
+        writer.write_shards(shards, render=requests.render, custom_id=requests.custom_id)
+
+    def batch_request_writer(self, requests: TeacherRequests) -> BatchRequestWriter:
+        """
+        Creates the writer of the batch requests of a teacher stage
+
+        :param requests: the requests
+        :return: the batch request writer
+        """
+        return BatchRequestWriter(model=self.options.open_ai_model, system_prompt=requests.system_prompt)
 
     def submit_batch(self, jsonl_path: str) -> str:
         uploaded_file = self.client.files.create(
@@ -181,68 +631,175 @@ class DoomTeacher(GamePalsTeacher):
 
     def load_multiple_batch_results(self, batch_ids: list[str]) -> None:
         """
-        Load results from multiple batches and combine them.
+        Load results from multiple batches, streaming the commands of each batch into the output file.
+        Once they are all loaded, self.user_commands is the (memory-mapped) UserCommandBatch of the output file.
 
         :param batch_ids: list of batch IDs to load results from
         """
-        all_results = {}
-
-        for i, batch_id in enumerate(batch_ids):
-            print(f"Loading results from batch {i + 1}/{len(batch_ids)}: {batch_id}")
-            batch_results = self.load_single_batch_results(batch_id)
-            all_results.update(batch_results)
-
-        self.user_commands = list()
-
-        for i in range(len(self.game_states)):
-            if f"state-{i}" in all_results:
-                result = all_results[f"state-{i}"].split("\n")
-                for line in result:
-                    data = json.loads(line)
-                    self.user_commands.append(
-                        UserCommandInfo(
-                            command=data["command"],
-                            game_state_idx=i,
-                            intent=data["intent"],
-                            explicitness=data["explicitness"],
-                            atomicity=data["atomicity"],
-                            contextuality=data["contextuality"],
-                        ))
-
-        # Save to file
-        with open(self.options.user_commands_batch_output_filepath, "w") as f:
-            json.dump([dataclasses.asdict(command) for command in self.user_commands], f, indent=2)
-
-        print(f"\nTotal user commands generated: {len(self.user_commands)}")
-
-    def load_single_batch_results(self, batch_id: str) -> dict:
+        output_path = self.options.user_commands_batch_output_filepath
+        with TeacherOutputParser(UserCommandInfo) as parser, UserCommandWriter(output_path) as writer:
+            for i, batch_id in enumerate(batch_ids):
+                print(f"Loading results from batch {i + 1}/{len(batch_ids)}: {batch_id}")
+                batch = self.client.batches.retrieve(batch_id)
+                if batch.status != "completed":
+                    raise RuntimeError(f"Batch {batch_id} ended with status: {batch.status}")
+                self.load_batch_user_commands(batch.output_file_id, writer, parser)
+        self.user_commands = UserCommandBatch.load(output_path)
+
+        print(f"\nTotal user commands generated: {writer.count}")
+
+    def load_batch_user_commands(
+            self,
+            output_file_id: str,
+            writer: UserCommandWriter,
+            parser: TeacherOutputParser[UserCommandInfo]
+    ) -> list[str]:
         """
-        Load results from a single batch.
+        Parse the user commands of a batch while its output file downloads,
+        appending them to the output file.
 
-        :param batch_id: the batch ID to load
-        :return: dictionary mapping custom_id to output text
+        :param output_file_id: the id of the output file of the batch
+        :param writer: the writer of the output file
+        :param parser: the parser of the outputs, quarantining the malformed ones
+        :return: the custom_ids of the quarantined outputs of the batch
         """
-        batch = self.client.batches.retrieve(batch_id)
-
-        if batch.status != "completed":
-            raise RuntimeError(f"Batch {batch_id} ended with status: {batch.status}")
+        load = self.user_command_loader(writer, parser)
+        return [custom_id for custom_id, output_text in self.iter_batch_results(output_file_id)
+                if not load(custom_id, output_text)]
+
+    def user_command_loader(
+            self,
+            writer: UserCommandWriter,
+            parser: TeacherOutputParser[UserCommandInfo]
+    ) -> Callable[[str, str], bool]:
+        """
+        Creates the function loading a user command generation output: it parses the output
+        and appends its user commands to the output file (without keeping them in memory).
 
-        output_file_id = batch.output_file_id
-        content = self.client.files.content(output_file_id)
+        :param writer: the writer of the output file
+        :param parser: the parser of the outputs, quarantining the malformed ones
+        :return: the function loading an output, given its custom_id and text, returning whether it is valid
+        """
+        def load(custom_id: str, output_text: str) -> bool:
+            game_state_idx = int(custom_id.removeprefix("state-"))
+            commands = parser.parse(custom_id, output_text, game_state_idx=game_state_idx)
+            writer.append(commands)
+            return bool(commands)
+
+        return load
+
+    def load_results(
+            self,
+            requests: TeacherRequests,
+            results: Iterable[tuple[str, str]],
+            load: Callable[[str, str], bool],
+            cache: bool = True
+    ) -> list[str]:
+        """
+        Load a stream of outputs, storing the valid ones into the response cache (if enabled)
 
-        # Parse jsonl output
-        results = {}
-        for line in content.iter_lines():
-            record = json.loads(line)
-            custom_id = record["custom_id"]
+        :param requests: the requests the outputs answer
+        :param results: the custom_id and output text of each request
+        :param load: the function loading an output, given its custom_id and text, returning whether it is valid
+        :param cache: whether to store the valid outputs into the response cache
+        :return: the custom_ids of the invalid outputs
+        """
+        invalid = list()
+        answered = list()
+        for custom_id, output_text in results:
+            if load(custom_id, output_text):
+                answered.append((requests.item_of(custom_id), output_text))
+            else:
+                invalid.append(custom_id)
+
+            if cache and len(answered) >= 10_000:
+                self.cache_responses(requests, answered)
+                answered = list()
+
+        if cache:
+            self.cache_responses(requests, answered)
+        return invalid
+
+    def cache_responses(self, requests: TeacherRequests, answered: list[tuple[int, str]]) -> None:
+        """
+        Store outputs into the response cache, if enabled
 
-            output_text = ""
-            for item in record["response"]["body"]["output"]:
-                for content_item in item["content"]:
-                    if content_item["type"] == "output_text":
-                        output_text += content_item["text"]
+        :param requests: the requests the outputs answer
+        :param answered: the item index and output text of each output
+        """
+        if self.response_cache is None or not answered:
+            return
+        keys = self.response_keys(requests, [idx for idx, _ in answered])
+        self.response_cache.put_many({key: output_text for key, (_, output_text) in zip(keys, answered)})
+
+    def calibrate_token_counter(
+            self,
+            requests: TeacherRequests,
+            usage: list[tuple[str, int]],
+            max_samples: int = 1000
+    ) -> None:
+        """
+        Fits the chars-per-token ratio of the token counter to the input tokens reported in the outputs of a batch,
+        so that the next shards (e.g. retries) are sized with the actual token counts.
+        Has no effect when a tokenizer is available.
 
-            results[custom_id] = output_text.strip()
+        :param requests: the requests the outputs answer
+        :param usage: the custom_id and input tokens of each output
+        :param max_samples: the maximum number of requests rendered to calibrate
+        """
+        if self.token_counter.encoding is not None or not usage:
+            return
+        usage = usage[:max_samples]
+        user_contents = requests.render([requests.item_of(custom_id) for custom_id, _ in usage])
+        self.token_counter.calibrate_requests(requests.system_prompt, user_contents, [n for _, n in usage])
+        print(f"Calibrated token counts to {self.token_counter.chars_per_token:.2f} chars per token")
+
+    def load_failed_custom_ids(self, shard: BatchShard) -> list[str]:
+        """
+        Load the custom ids of the failed requests of an ended batch, from its error file.
 
-        return results
+        :param shard: the shard of the batch
+        :return: the custom ids of the failed requests
+        """
+        if shard.error_file_id is None:
+            return []
+        with self.client.files.with_streaming_response.content(shard.error_file_id) as response:
+            return [json.loads(line)["custom_id"] for line in response.iter_lines() if line]
+
+    def iter_batch_results(
+            self,
+            output_file_id: str,
+            usage: list[tuple[str, int]] | None = None
+    ) -> Iterator[tuple[str, str]]:
+        """
+        Stream the results of a batch, line by line, without loading its whole output file.
 
+        :param output_file_id: the id of the output file of the batch
+        :param usage: the (optional) list to which the custom_id and input tokens of each successful request are appended
+        :return: an iterator of the custom_id and output text of each successful request
+        """
+        # A batch whose requests all failed has no output file
+        if output_file_id is None:
+            return
+        with self.client.files.with_streaming_response.content(output_file_id) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                custom_id = record["custom_id"]
+
+                # Failed requests are retried in another batch
+                if record.get("error") or not record.get("response") or record["response"].get("status_code") != 200:
+                    continue
+
+                body = record["response"]["body"]
+                if usage is not None and body.get("usage"):
+                    usage.append((custom_id, body["usage"]["input_tokens"]))
+
+                output_text = ""
+                for item in body["output"]:
+                    for content_item in item["content"]:
+                        if content_item["type"] == "output_text":
+                            output_text += content_item["text"]
+
+                yield custom_id, output_text.strip()
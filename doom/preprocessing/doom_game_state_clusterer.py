@@ -1,8 +1,11 @@
-from typing import Counter
+from typing import Counter, Iterable
 import numpy as np
 
 from doom.utils.doom_game_state import DoomGameState, MonsterType, WeaponName, AimedAtType
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
 from core.knowledge.dataset_clusterer import DatasetClusterer
+from core.knowledge.clustering_backends import ClusteringBackend
+from core.knowledge.cluster_index import ClusterIndex
 
 
 class DoomGameStateClusterer(DatasetClusterer):
@@ -10,10 +13,29 @@ class DoomGameStateClusterer(DatasetClusterer):
     A DatasetClusterer specialized for doom game states
     """
 
-    def __init__(self):
-        """Creates a DoomGameStateClusterer"""
+    # The columns read by to_features_batch, e.g. to load a projected DoomGameStateBatch
+    FEATURE_FIELDS = [
+        'MONSTERS.distance',
+        'MONSTERS.monsterType',
+        'INVENTORY.currentSlot',
+        'INVENTORY.inventorySlots.ammoCount',
+        'INVENTORY.inventorySlots.weaponName',
+        'AIMED_AT.interactable',
+        'AIMED_AT.entityType',
+    ]
+
+    def __init__(self, backend: ClusteringBackend | None = None, index: ClusterIndex | None = None):
+        """
+        Creates a DoomGameStateClusterer
+
+        :param backend: the clustering algorithm, DBSCAN(eps=1e-2, min_samples=1) by default
+        :param index: the clusters of a previous run (see ClusterIndex.load), to continue with update
+        """
         super().__init__(
-            to_features=self.to_features
+            to_features=self.to_features,
+            to_features_batch=self.to_features_batch,
+            backend=backend,
+            index=index,
         )
 
     @staticmethod
@@ -81,3 +103,76 @@ class DoomGameStateClusterer(DatasetClusterer):
         features.extend(DoomGameStateClusterer.one_hot(aimed_type, list(AimedAtType)))
 
         return np.array(features, dtype=np.float32)
+
+    @staticmethod
+    def to_features_batch(x: DoomGameStateBatch | Iterable[DoomGameState]) -> np.ndarray:
+        """
+        Computes the features of a whole batch of game states at once.
+        Row i is identical to to_features(x[i]): the one-hot tables are built by calling the same
+        per-item helpers once per enum member, and ties on the most common enemy type are broken
+        by first occurrence, like Counter.most_common.
+
+        :param x: a doom game state batch (possibly projected on FEATURE_FIELDS), or a dataset of game states
+        :return: the features matrix, with one row per game state
+        """
+        if not isinstance(x, DoomGameStateBatch):
+            x = DoomGameStateBatch.from_dataset(x)
+
+        monster_types = list(MonsterType)
+        weapon_names = list(WeaponName)
+        aimed_types = list(AimedAtType)
+
+        # Lookup tables from enum codes to one-hot vectors
+        monster_table = np.array([DoomGameStateClusterer.one_hot(t, monster_types) for t in monster_types])
+        weapon_table = np.array([DoomGameStateClusterer.one_hot(w.lower(), weapon_names) for w in weapon_names])
+        aimed_table = np.array([
+            DoomGameStateClusterer.one_hot(a.lower() if a else "none", aimed_types) for a in aimed_types
+        ])
+
+        n = len(x)
+        counts = x.monster_counts
+        has_monsters = counts > 0
+        features = list()
+
+        # --- Number of monsters ---
+        features.append(counts[:, None])
+
+        # --- Closest enemy distance ---
+        closest = np.ones((n, 1))
+        if has_monsters.any():
+            starts = x.monster_offsets[:-1][has_monsters]
+            min_distance = np.minimum.reduceat(x.columns['MONSTERS.distance'], starts)
+            closest[has_monsters, 0] = np.array([0.0, 0.5, 1.0])[np.digitize(min_distance, [256, 768])]
+        features.append(closest)
+
+        # --- Most common enemy type (one-hot) ---
+        common_type = np.zeros((n, len(monster_types)))
+        if has_monsters.any():
+            k = len(monster_types)
+            keys = x.monster_states() * k + x.columns['MONSTERS.monsterType']
+            type_counts = np.bincount(keys, minlength=n * k).reshape(n, k)
+            unique_keys, first_index = np.unique(keys, return_index=True)
+            first_seen = np.full(n * k, len(keys))
+            first_seen[unique_keys] = first_index
+            first_seen = first_seen.reshape(n, k)
+            is_most_common = type_counts == type_counts.max(axis=1, keepdims=True)
+            dominant = np.argmin(np.where(is_most_common, first_seen, len(keys)), axis=1)
+            common_type[has_monsters] = monster_table[dominant[has_monsters]]
+        features.append(common_type)
+
+        # --- Ammo status ---
+        current = x.current_slots()
+        ammo = x.columns['INVENTORY.inventorySlots.ammoCount'][current]
+        ammo_status = np.where(ammo == 0, 0.0, np.array([0.33, 0.66, 1.0])[np.digitize(ammo, [10, 40])])
+        features.append(ammo_status[:, None])
+
+        # --- Weapon name (one-hot) ---
+        features.append(weapon_table[x.columns['INVENTORY.inventorySlots.weaponName'][current]])
+
+        # --- Is aiming at interactable ---
+        features.append(x.columns['AIMED_AT.interactable'][:, None])
+
+        # --- Aimed-at type (one-hot) ---
+        features.append(aimed_table[x.columns['AIMED_AT.entityType']])
+
+        return np.hstack(features).astype(np.float32)
@@ -1,5 +1,9 @@
+from typing import Iterable, Iterator
+import numpy as np
+
 from core.datasets import GamePalsDatasetTransformer, GamePalsDataset
 from doom.utils.doom_game_state import DoomGameState
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
 
 
 class DoomGameStateFilterer(GamePalsDatasetTransformer):
@@ -18,13 +22,24 @@ class DoomGameStateFilterer(GamePalsDatasetTransformer):
         * there are monsters
         * the player is aiming at an interactable object
 
-        :param x: a gamepals dataset
-        :return: the new gamepals dataset
+        :param x: a gamepals dataset, or a doom game state batch
+        :return: the new gamepals dataset (or doom game state batch)
+        """
+        if isinstance(x, DoomGameStateBatch):
+            relevant = (x.monster_counts > 0) | x.columns['AIMED_AT.interactable']
+            return x.take(np.flatnonzero(relevant))
+
+        return GamePalsDataset(self.stream(x))
+
+    def stream(self, items: Iterable[DoomGameState]) -> Iterator[DoomGameState]:
+        """
+        Lazily filters a stream of game states, with the same conditions as transform
+
+        :param items: the stream of game states
+        :return: the stream of relevant game states
         """
-        new_x = GamePalsDataset()
-        for state in x:
+        for state in items:
             if len(state.MONSTERS) > 0:
-                new_x.append(state)
+                yield state
             elif state.AIMED_AT.interactable:
-                new_x.append(state)
-        return new_x
+                yield state
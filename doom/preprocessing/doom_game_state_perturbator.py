@@ -1,9 +1,9 @@
 from typing import Iterable
-import random
 import numpy as np
 
 from core.knowledge.dataset_perturbator import DatasetPerturbator
 from doom.utils.doom_game_state import DoomGameState, AimedAtType
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
 
 
 class DoomGameStatePerturbator(DatasetPerturbator):
@@ -14,66 +14,217 @@ class DoomGameStatePerturbator(DatasetPerturbator):
     N_AMMO_PERTURBATIONS = 2
     DROP_PROBABILITY = 0.3
 
-    def __init__(self):
-        """Creates a DoomGameStatePerturbator"""
+    def __init__(self, seed: int | None = None, n_workers: int = 1):
+        """
+        Creates a DoomGameStatePerturbator
+
+        :param seed: the seed of all the perturbations, None to draw a random one
+        :param n_workers: the number of processes the dataset is sharded across
+        """
         super().__init__(
-            perturbate=self.perturbate
+            perturbate=self.perturbate,
+            perturbate_batch=self.perturbate_batch,
+            seed=seed,
+            n_workers=n_workers,
+            count_perturbations=self.count_perturbations,
+        )
+
+    @staticmethod
+    def count_perturbations(state: DoomGameState) -> int:
+        """
+        Counts the perturbations perturbate produces for a game state
+
+        :param state: the game state
+        :return: the number of perturbations
+        """
+        n_monster_perturbations = (
+            DoomGameStatePerturbator.N_MONSTER_PERTURBATIONS
+            if state.AIMED_AT.entityType != AimedAtType.MONSTER
+            else 0
         )
+        return n_monster_perturbations + DoomGameStatePerturbator.N_AMMO_PERTURBATIONS
 
     @staticmethod
-    def perturbate_number(x: float, p: float = 0.5, delta: float = 0.1) -> float:
-        if random.random() > p:
+    def perturbate_number(x: float, u: float, z: float, p: float = 0.5, delta: float = 0.1) -> float:
+        """
+        Perturbs a value with probability p, with gaussian noise relative to the value
+
+        :param x: the value to perturbate
+        :param u: a uniform draw in [0, 1), deciding whether the value is perturbed
+        :param z: a standard normal draw, the noise before scaling
+        :param p: the probability of perturbing the value
+        :param delta: the standard deviation of the noise, relative to the value
+        :return: the perturbed value
+        """
+        if u > p:
             return x
-        scale = max(abs(x) * delta, 1E-3)
-        noise = np.random.normal(loc=0.0, scale=scale)
-        return x + noise
+        return x + z * max(abs(x) * delta, 1E-3)
+
+    @staticmethod
+    def perturbate_numbers(x: np.ndarray, u: np.ndarray, z: np.ndarray, p: float = 0.5, delta: float = 0.1) -> np.ndarray:
+        """
+        Vectorized version of perturbate_number: each value is perturbed with probability p
+
+        :param x: the values to perturbate
+        :param u: a uniform draw in [0, 1) for each value
+        :param z: a standard normal draw for each value
+        :param p: the probability of perturbing each value
+        :param delta: the standard deviation of the noise, relative to each value
+        :return: the perturbed values
+        """
+        return np.where(u <= p, x + z * np.maximum(np.abs(x) * delta, 1E-3), x)
+
+    @staticmethod
+    def draw(n_monster_rows: int, n_slot_rows: int, rng: np.random.Generator) -> tuple[np.ndarray, ...]:
+        """
+        Draws all the random numbers of the perturbations of a game state at once, in the fixed layout
+        shared by perturbate and perturbate_batch: one row per monster of each monster perturbation,
+        and one row per inventory slot of each ammo perturbation (drawn even when unused).
+
+        :param n_monster_rows: the number of monster perturbations times the number of monsters
+        :param n_slot_rows: the number of ammo perturbations times the number of inventory slots
+        :param rng: the random generator of the game state
+        :return: the uniform (drop, distance, angle, pitch) and normal (distance, angle, pitch) draws of each
+            monster row, and the uniform (ammo, canUse) and normal (ammo) draws of each slot row
+        """
+        return (
+            rng.random((n_monster_rows, 4)),
+            rng.standard_normal((n_monster_rows, 3)),
+            rng.random((n_slot_rows, 2)),
+            rng.standard_normal(n_slot_rows),
+        )
 
     @staticmethod
-    def perturbate(state: DoomGameState) -> Iterable[DoomGameState]:
+    def perturbate(state: DoomGameState, rng: np.random.Generator | None = None) -> Iterable[DoomGameState]:
+        if rng is None:
+            rng = np.random.default_rng()
+
+        n_monster_perturbations = DoomGameStatePerturbator.count_perturbations(state) - DoomGameStatePerturbator.N_AMMO_PERTURBATIONS
+        monster_u, monster_z, slot_u, slot_z = DoomGameStatePerturbator.draw(
+            n_monster_perturbations * len(state.MONSTERS),
+            DoomGameStatePerturbator.N_AMMO_PERTURBATIONS * len(state.INVENTORY.inventorySlots),
+            rng,
+        )
+        monster_u, monster_z, slot_u, slot_z = monster_u.tolist(), monster_z.tolist(), slot_u.tolist(), slot_z.tolist()
+        perturbate_number = DoomGameStatePerturbator.perturbate_number
+
+        # Perturbations only copy the models they change: unchanged sub-models are shared with the original state
+
         # Tweak distance and position of each monster
-        if state.AIMED_AT.entityType != AimedAtType.MONSTER:
-            for i in range(DoomGameStatePerturbator.N_MONSTER_PERTURBATIONS):
-                monsters = [
-                    m.model_copy(
-                        update=dict(
-                            distance=max(DoomGameStatePerturbator.perturbate_number(m.distance, p=0.7, delta=0.1), 25),
-                            relativeAngle=DoomGameStatePerturbator.perturbate_number(m.relativeAngle, p=0.7, delta=0.1),
-                            relativePitch=DoomGameStatePerturbator.perturbate_number(m.relativePitch, p=0.7, delta=0.1),
-                        ),
-                        deep=True
-                    )
-                    for m in state.MONSTERS
-                    if random.random() > DoomGameStatePerturbator.DROP_PROBABILITY
-                ]
-                yield state.model_copy(
+        row = 0
+        for i in range(n_monster_perturbations):
+            monsters = list()
+            for m in state.MONSTERS:
+                u, z = monster_u[row], monster_z[row]
+                row += 1
+                if u[0] <= DoomGameStatePerturbator.DROP_PROBABILITY:
+                    continue
+                monsters.append(m.model_copy(
                     update=dict(
-                        MONSTERS=monsters
-                    ),
-                    deep=True
+                        distance=max(perturbate_number(m.distance, u[1], z[0], p=0.7, delta=0.1), 25),
+                        relativeAngle=perturbate_number(m.relativeAngle, u[2], z[1], p=0.7, delta=0.1),
+                        relativePitch=perturbate_number(m.relativePitch, u[3], z[2], p=0.7, delta=0.1),
+                    )
+                ))
+            yield state.model_copy(
+                update=dict(
+                    MONSTERS=monsters
                 )
+            )
 
         # Tweak inventory ammunition count
+        row = 0
         for i in range(DoomGameStatePerturbator.N_AMMO_PERTURBATIONS):
-            slots = [
-                s.model_copy(
+            slots = list()
+            for s in state.INVENTORY.inventorySlots:
+                u, z = slot_u[row], slot_z[row]
+                row += 1
+                slots.append(s.model_copy(
                     update=dict(
-                        ammoCount=max(
-                            int(round(DoomGameStatePerturbator.perturbate_number(s.ammoCount, p=0.7, delta=0.3))
-                                ), 0),
-                        canUse=s.canUse if not s.canUse or s.index == 1 else random.random() > DoomGameStatePerturbator.DROP_PROBABILITY
-                    ),
-                    deep=True
-                )
-                for s in state.INVENTORY.inventorySlots
-            ]
+                        ammoCount=max(int(round(perturbate_number(s.ammoCount, u[0], z, p=0.7, delta=0.3))), 0),
+                        canUse=s.canUse if not s.canUse or s.index == 1 else u[1] > DoomGameStatePerturbator.DROP_PROBABILITY
+                    )
+                ))
             yield state.model_copy(
                 update=dict(
                     INVENTORY=state.INVENTORY.model_copy(
                         update=dict(
                             inventorySlots=slots
-                        ),
-                        deep=True
+                        )
                     )
-                ),
-                deep=True
+                )
             )
+
+    @staticmethod
+    def perturbate_batch(x: DoomGameStateBatch, rngs: list[np.random.Generator]) -> DoomGameStateBatch:
+        """
+        Produces the perturbations of a whole batch of game states at once.
+        Each game state draws its random numbers from its own generator, in the same layout as perturbate,
+        and the draws are then applied with one vectorized operation per field: the output is identical
+        to perturbate applied state by state, and only the perturbed columns are rebuilt.
+
+        :param x: a doom game state batch
+        :param rngs: the random generator of each game state
+        :return: the doom game state batch of the perturbations
+        """
+        # Plan the output rows: for each state, its monster perturbations (unless aiming at a monster),
+        # followed by its ammo perturbations
+        aiming_at_monster = x.columns['AIMED_AT.entityType'] == list(AimedAtType).index(AimedAtType.MONSTER)
+        n_monster_perturbations = np.where(aiming_at_monster, 0, DoomGameStatePerturbator.N_MONSTER_PERTURBATIONS)
+        n_perturbations = n_monster_perturbations + DoomGameStatePerturbator.N_AMMO_PERTURBATIONS
+
+        # Draws are concatenated state by state, i.e. in the order of the monster and slot rows of the output
+        draws = [
+            DoomGameStatePerturbator.draw(n_monster_rows, n_slot_rows, rng)
+            for n_monster_rows, n_slot_rows, rng in zip(
+                (n_monster_perturbations * x.monster_counts).tolist(),
+                (DoomGameStatePerturbator.N_AMMO_PERTURBATIONS * x.slot_counts).tolist(),
+                rngs,
+            )
+        ]
+        monster_u, monster_z, slot_u, slot_z = (
+            np.concatenate([draw[k] for draw in draws]) if draws else empty
+            for k, empty in enumerate((np.empty((0, 4)), np.empty((0, 3)), np.empty((0, 2)), np.empty(0)))
+        )
+
+        sources = np.repeat(np.arange(len(x)), n_perturbations)
+        starts = np.cumsum(n_perturbations) - n_perturbations
+        variants = np.arange(len(sources)) - np.repeat(starts, n_perturbations)
+        is_monster_perturbation = variants < n_monster_perturbations[sources]
+        out = x.take(sources)
+
+        # Tweak distance and position of each monster
+        tweaked = is_monster_perturbation[out.monster_states()]
+        columns = dict()
+        for k, (name, delta, minimum) in enumerate((
+                ('MONSTERS.distance', 0.1, 25),
+                ('MONSTERS.relativeAngle', 0.1, None),
+                ('MONSTERS.relativePitch', 0.1, None),
+        )):
+            values = out.columns[name].copy()
+            values[tweaked] = DoomGameStatePerturbator.perturbate_numbers(
+                values[tweaked], monster_u[:, k + 1], monster_z[:, k], p=0.7, delta=delta
+            )
+            if minimum is not None:
+                values[tweaked] = np.maximum(values[tweaked], minimum)
+            columns[name] = values
+        keep = np.ones(len(tweaked), dtype=bool)
+        keep[tweaked] = monster_u[:, 0] > DoomGameStatePerturbator.DROP_PROBABILITY
+        out = out.with_columns(columns).filter_group(DoomGameStateBatch.MONSTERS, keep)
+
+        # Tweak inventory ammunition count
+        tweaked = ~is_monster_perturbation[out.slot_states()]
+        ammo = out.columns['INVENTORY.inventorySlots.ammoCount'].copy()
+        ammo[tweaked] = np.maximum(np.rint(
+            DoomGameStatePerturbator.perturbate_numbers(ammo[tweaked].astype(np.float64), slot_u[:, 0], slot_z, p=0.7, delta=0.3)
+        ), 0)
+        can_use = out.columns['INVENTORY.inventorySlots.canUse'].copy()
+        redraw = can_use[tweaked] & (out.columns['INVENTORY.inventorySlots.index'][tweaked] != 1)
+        tweaked_can_use = can_use[tweaked]
+        tweaked_can_use[redraw] = slot_u[redraw, 1] > DoomGameStatePerturbator.DROP_PROBABILITY
+        can_use[tweaked] = tweaked_can_use
+
+        return out.with_columns({
+            'INVENTORY.inventorySlots.ammoCount': ammo,
+            'INVENTORY.inventorySlots.canUse': can_use,
+        })
@@ -80,6 +80,13 @@ class InventoryModel(BaseModel):
     inventorySlots: list[InventorySlotModel]
 
 
+# Precompiled formats of the TOON representation of a game state (see DoomGameState.toonify)
+AIMED_AT_FORMAT = "AIMED_AT:\n  type: {}\n  distance: {:.2f}\n  interactable: {}\n\nMONSTERS (count={}):".format
+MONSTER_FORMAT = "\n  - ({}, {}, {:.2f}, {:.2f}, {:.2f})".format
+INVENTORY_FORMAT = "\n\nINVENTORY:\n  current_slot: {}\n  weapons:".format
+WEAPON_FORMAT = "\n    - ({}, {}, {})".format
+
+
 class DoomGameState(BaseModel):
     AIMED_AT: AimedAtModel
     MONSTERS: list[MonsterModel]
@@ -90,26 +97,26 @@ class DoomGameState(BaseModel):
     def to_prompt_ready(self) -> str:
         """
         Returns the string representation of the game state, ready to be prompted to an LLM.
+        It renders the same text as toonify, reading the attributes directly instead of going through model_dump.
 
         :return: the string representation of the game state
         """
-        d = self.model_dump()
-        del d['GROUND_CHECK']
-        del d['AIMED_AT']['horizontalAngle']
-        del d['AIMED_AT']['verticalAngle']
-        for m in d['MONSTERS']:
-            del m['monsterMass']
-            del m['inFOV']
-            del m['screenX']
-            del m['screenY']
-        d['INVENTORY']['inventorySlots'] = [
-            w
-            for w in d['INVENTORY']['inventorySlots']
-            if w['canUse']
-        ]
-        for w in d['INVENTORY']['inventorySlots']:
-            del w['canUse']
-        return self.toonify(d)
+        aimed = self.AIMED_AT
+        monsters = self.MONSTERS
+        inventory = self.INVENTORY
+        return "".join([
+            AIMED_AT_FORMAT(aimed.entityType, aimed.distance, 'yes' if aimed.interactable else 'no', len(monsters)),
+            *[
+                MONSTER_FORMAT(m.monsterType, m.monsterHealth, m.distance, m.relativeAngle, m.relativePitch)
+                for m in monsters
+            ],
+            INVENTORY_FORMAT(inventory.currentSlot),
+            *[
+                WEAPON_FORMAT(w.index, w.weaponName, w.ammoCount)
+                for w in inventory.inventorySlots
+                if w.canUse
+            ],
+        ])
 
     @staticmethod
     def toonify(state: dict) -> str:
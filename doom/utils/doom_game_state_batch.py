@@ -0,0 +1,81 @@
+from typing import Iterable
+
+import numpy as np
+
+from core.datasets import ColumnarBatch, GamePalsDataset
+from doom.utils.doom_game_state import DoomGameState
+
+
+class DoomGameStateBatch(ColumnarBatch[DoomGameState]):
+    """
+    A struct-of-arrays batch of DoomGameStates.
+    Scalar fields are NumPy columns (e.g. 'AIMED_AT.interactable'), the MonsterType, WeaponName and
+    AimedAtType enums are integer codes into the enum members, and MONSTERS and INVENTORY.inventorySlots
+    are ragged groups indexed through CSR-style offsets.
+    """
+
+    MONSTERS = 'MONSTERS'
+    SLOTS = 'INVENTORY.inventorySlots'
+
+    @classmethod
+    def from_dataset(cls, x: Iterable[DoomGameState]) -> "DoomGameStateBatch":
+        """
+        Builds a DoomGameStateBatch from a dataset of game states
+
+        :param x: a gamepals dataset (or any iterable) of doom game states
+        :return: the doom game state batch
+        """
+        return cls.from_items(x, DoomGameState)
+
+    def to_dataset(self) -> GamePalsDataset[DoomGameState]:
+        """
+        Rebuilds the dataset of game states represented by the batch
+
+        :return: the gamepals dataset
+        """
+        return GamePalsDataset(self.to_items())
+
+    @property
+    def monster_offsets(self) -> np.ndarray:
+        return self.offsets(self.MONSTERS)
+
+    @property
+    def slot_offsets(self) -> np.ndarray:
+        return self.offsets(self.SLOTS)
+
+    @property
+    def monster_counts(self) -> np.ndarray:
+        return np.diff(self.monster_offsets)
+
+    @property
+    def slot_counts(self) -> np.ndarray:
+        return np.diff(self.slot_offsets)
+
+    def monster_states(self) -> np.ndarray:
+        """
+        Computes the index of the game state each monster belongs to
+
+        :return: an array with one state index per monster
+        """
+        return np.repeat(np.arange(len(self)), self.monster_counts)
+
+    def slot_states(self) -> np.ndarray:
+        """
+        Computes the index of the game state each inventory slot belongs to
+
+        :return: an array with one state index per inventory slot
+        """
+        return np.repeat(np.arange(len(self)), self.slot_counts)
+
+    def current_slots(self) -> np.ndarray:
+        """
+        Computes the position of each state's current inventory slot in the slot columns,
+        with the same (list indexing) semantics of state.INVENTORY.inventorySlots[state.INVENTORY.currentSlot]
+
+        :return: an array with one slot position per game state
+        """
+        current = self.columns['INVENTORY.currentSlot']
+        counts = self.slot_counts
+        if np.any((current >= counts) | (current < -counts)):
+            raise IndexError("INVENTORY.currentSlot is out of range for some game states")
+        return self.slot_offsets[:-1] + np.where(current < 0, current + counts, current)
@@ -0,0 +1,121 @@
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from doom.utils.doom_game_state import (
+    DoomGameState,
+    AIMED_AT_FORMAT,
+    MONSTER_FORMAT,
+    INVENTORY_FORMAT,
+    WEAPON_FORMAT,
+)
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
+
+# The collection being rendered by DoomGameStateRenderer.render_parallel, inherited by its forked workers
+_shared_states = None
+
+
+def _render_shared(start: int, end: int) -> list[str]:
+    if isinstance(_shared_states, DoomGameStateBatch):
+        return DoomGameStateRenderer.render_batch(_shared_states.take(range(start, end)))
+    return DoomGameStateRenderer.render_many(_shared_states[start:end])
+
+
+class DoomGameStateRenderer:
+    """
+    Renders many DoomGameStates into their prompt-ready text at once.
+    The rendered text is identical to DoomGameState.to_prompt_ready.
+    An instance additionally renders large collections in parallel worker processes.
+    """
+
+    def __init__(self, n_workers: int = 1, chunk_size: int = 4096):
+        """
+        Creates a DoomGameStateRenderer
+
+        :param n_workers: the number of worker processes, 1 to render in the calling process
+        :param chunk_size: the number of game states rendered by a worker at once
+        """
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+
+    def render_parallel(self, x: DoomGameStateBatch | list[DoomGameState]) -> list[str]:
+        """
+        Renders a collection of game states, splitting it into chunks rendered by forked worker processes.
+        The workers inherit the game states from the calling process instead of receiving them pickled,
+        which would cost more than rendering them.
+
+        :param x: a doom game state batch, or a list of doom game states
+        :return: the prompt-ready text of each game state, in order
+        """
+        if self.n_workers <= 1 or len(x) <= self.chunk_size or "fork" not in mp.get_all_start_methods():
+            return DoomGameStateRenderer.render_many(x)
+
+        global _shared_states
+        _shared_states = x
+        try:
+            with ProcessPoolExecutor(self.n_workers, mp_context=mp.get_context("fork")) as executor:
+                starts = range(0, len(x), self.chunk_size)
+                ends = [min(start + self.chunk_size, len(x)) for start in starts]
+                return [text for texts in executor.map(_render_shared, starts, ends) for text in texts]
+        finally:
+            _shared_states = None
+
+    @staticmethod
+    def render_many(x: DoomGameStateBatch | Iterable[DoomGameState]) -> list[str]:
+        """
+        Renders a collection of game states
+
+        :param x: a doom game state batch, or any iterable of doom game states
+        :return: the prompt-ready text of each game state
+        """
+        if isinstance(x, DoomGameStateBatch):
+            return DoomGameStateRenderer.render_batch(x)
+        return [state.to_prompt_ready() for state in x]
+
+    @staticmethod
+    def render_batch(x: DoomGameStateBatch) -> list[str]:
+        """
+        Renders a batch of game states straight from its columns, without rebuilding the models.
+        Each kind of line is formatted once for the whole batch, and the lines are then joined state by state.
+
+        :param x: a doom game state batch
+        :return: the prompt-ready text of each game state
+        """
+        monster_offsets = x.monster_offsets.tolist()
+        slot_offsets = x.slot_offsets.tolist()
+
+        heads = list(map(
+            AIMED_AT_FORMAT,
+            x.decode('AIMED_AT.entityType').tolist(),
+            x.columns['AIMED_AT.distance'].tolist(),
+            ['yes' if interactable else 'no' for interactable in x.columns['AIMED_AT.interactable'].tolist()],
+            x.monster_counts.tolist(),
+        ))
+        monsters = list(map(
+            MONSTER_FORMAT,
+            x.decode('MONSTERS.monsterType').tolist(),
+            x.columns['MONSTERS.monsterHealth'].tolist(),
+            x.columns['MONSTERS.distance'].tolist(),
+            x.columns['MONSTERS.relativeAngle'].tolist(),
+            x.columns['MONSTERS.relativePitch'].tolist(),
+        ))
+        inventories = list(map(INVENTORY_FORMAT, x.columns['INVENTORY.currentSlot'].tolist()))
+        weapons = [
+            WEAPON_FORMAT(index, weapon_name, ammo) if can_use else ""
+            for index, weapon_name, ammo, can_use in zip(
+                x.columns['INVENTORY.inventorySlots.index'].tolist(),
+                x.decode('INVENTORY.inventorySlots.weaponName').tolist(),
+                x.columns['INVENTORY.inventorySlots.ammoCount'].tolist(),
+                x.columns['INVENTORY.inventorySlots.canUse'].tolist(),
+            )
+        ]
+
+        return [
+            "".join([
+                heads[i],
+                *monsters[monster_offsets[i]:monster_offsets[i + 1]],
+                inventories[i],
+                *weapons[slot_offsets[i]:slot_offsets[i + 1]],
+            ])
+            for i in range(len(x))
+        ]
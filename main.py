@@ -1,7 +1,7 @@
 import os
 import dotenv
 
-from core.datasets import GamePalsDataset
+from core.datasets import GamePalsDataset, GamePalsDatasetPipeline
 from doom.kd.doom_teacher import DoomTeacher, DoomTeacherOptions
 from doom.preprocessing.doom_game_state_clusterer import DoomGameStateClusterer
 from doom.preprocessing.doom_game_state_filterer import DoomGameStateFilterer
@@ -11,34 +11,19 @@ from doom.utils.doom_game_state import DoomGameState
 dotenv.load_dotenv()
 
 #
-# gamestates = [
-#     DoomGameState.model_validate_json(line[15:])
-#     for filepath in os.scandir("data/gamelogs")
-#     for line in open(filepath)
-#     if line.startswith("[GS] GAMESTATE ")
-# ]
-# dataset = GamePalsDataset(gamestates)
-#
-# print(len(dataset))
-# dataset.save("data/gamestates/original-gamestates.json")
-#
-# dataset = dataset.apply(
+# dataset = GamePalsDatasetPipeline(
+#     GamePalsDataset.from_gamelogs(
+#         "data/gamelogs",
+#         cls=DoomGameState,
+#         n_workers=os.cpu_count(),
+#     )
+# ).apply(
 #     DoomGameStateFilterer()
-# )
-#
-# print(len(dataset))
-# dataset.save("data/gamestates/filtered-gamestates.json")
-#
-# dataset = dataset.apply(
+# ).apply(
 #     DoomGameStateClusterer()
-# )
-#
-# print(len(dataset))
-# dataset.save("data/gamestates/clustered-gamestates.json")
-#
-# dataset = dataset.apply(
+# ).apply(
 #     DoomGameStatePerturbator()
-# )
+# ).collect()
 #
 # print(len(dataset))
 # dataset.save("data/gamestates/perturbated-gamestates.json")
@@ -54,9 +39,8 @@ teacher = DoomTeacher(
         prompt_data_filepath='prompts/doom-prompt-data.json',
         open_ai_model='gpt-5.1',
         user_commands_batch_input_filepath='data/batches/user-commands-input.jsonl',
-        user_commands_batch_output_filepath='data/batches/user-commands-output.json',
+        user_commands_batch_output_filepath='data/batches/user-commands-output',
         max_tokens_per_batch=900000,
-        estimated_tokens_per_request=3000
     )
 )
 
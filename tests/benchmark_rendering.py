@@ -0,0 +1,32 @@
+"""
+Benchmarks the renderings of game states: python -m tests.benchmark_rendering [number of states]
+"""
+import sys
+import time
+
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
+from doom.utils.doom_game_state_renderer import DoomGameStateRenderer
+from tests.synthetic import synthetic_states
+from tests.test_doom_game_state_renderer import reference_prompt
+
+
+def timed(name: str, render, *args) -> list[str]:
+    start = time.perf_counter()
+    prompts = render(*args)
+    print(f"{name}: {time.perf_counter() - start:.2f}s")
+    return prompts
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    states = synthetic_states(n)
+    batch = DoomGameStateBatch.from_dataset(states)
+    print(f"Rendering {n} synthetic game states")
+
+    expected = timed("model_dump + toonify", lambda: [reference_prompt(state) for state in states])
+    results = [
+        timed("to_prompt_ready", lambda: [state.to_prompt_ready() for state in states]),
+        timed("render_batch", DoomGameStateRenderer.render_batch, batch),
+        timed("render_parallel (4 workers)", DoomGameStateRenderer(n_workers=4).render_parallel, states),
+    ]
+    print(f"Byte-identical: {all(prompts == expected for prompts in results)}")
@@ -0,0 +1,73 @@
+import random
+
+from doom.utils.doom_game_state import (
+    AimedAtModel, AimedAtType, DoomGameState, GroundCheckModel, InventoryModel, InventorySlotModel,
+    MonsterModel, MonsterType, WeaponName,
+)
+
+
+def synthetic_state(r: random.Random) -> DoomGameState:
+    """
+    Draws a random doom game state, covering the edge cases of the features and of the rendering:
+    states without monsters, ties on the most common monster type, distances on bucket boundaries,
+    empty ammo and unusable inventory slots.
+
+    :param r: the random number generator
+    :return: the game state
+    """
+    monsters = [
+        MonsterModel(
+            monsterType=r.choice(list(MonsterType)),
+            monsterMass=r.randint(50, 1000),
+            monsterHealth=r.randint(1, 300),
+            distance=r.choice([r.uniform(0, 1200), 100.0, 300.0]),
+            relativeAngle=r.uniform(-180, 180),
+            relativePitch=r.uniform(-30, 30),
+            inFOV=r.random() > 0.5,
+            screenX=r.random(),
+            screenY=r.random(),
+        )
+        for _ in range(r.choice([0, 0, 1, 2, 3, 5]))
+    ]
+    slots = [
+        InventorySlotModel(
+            index=i,
+            weaponName=r.choice(list(WeaponName)),
+            ammoCount=r.choice([0, 5, 20, 50, r.randint(0, 200)]),
+            canUse=r.random() > 0.3,
+        )
+        for i in range(r.randint(1, 4))
+    ]
+    return DoomGameState(
+        AIMED_AT=AimedAtModel(
+            entityType=r.choice(list(AimedAtType)),
+            distance=r.uniform(0, 2000),
+            interactable=r.random() > 0.7,
+            horizontalAngle=r.uniform(-1, 1),
+            verticalAngle=r.uniform(-1, 1),
+        ),
+        MONSTERS=monsters,
+        INVENTORY=InventoryModel(currentSlot=r.randrange(len(slots)), inventorySlots=slots),
+        GROUND_CHECK=GroundCheckModel(
+            isSprinting=r.random() > 0.5,
+            terrainType=r.choice(['Normal', 'Water', 'Lava']),
+            obstacleDistance=r.uniform(0, 100),
+            floorHeightAhead=r.uniform(-10, 10),
+            playerFloorHeight=r.uniform(-10, 10),
+            heightDifference=r.uniform(-5, 5),
+            isJumpable=r.random() > 0.5,
+            isInAir=False,
+        ),
+    )
+
+
+def synthetic_states(n: int, seed: int = 0) -> list[DoomGameState]:
+    """
+    Draws random doom game states
+
+    :param n: the number of game states
+    :param seed: the seed of the random number generator
+    :return: the game states
+    """
+    r = random.Random(seed)
+    return [synthetic_state(r) for _ in range(n)]
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+from core.datasets import GamePalsDataset
+from core.knowledge.dataset_clusterer import DatasetClusterer
+from doom.preprocessing.doom_game_state_clusterer import DoomGameStateClusterer
+from tests.synthetic import synthetic_states
+
+
+def reference_centers(x: GamePalsDataset) -> list:
+    """The cluster centers found by running DBSCAN on every feature row, without collapsing duplicates."""
+    features = np.array([DoomGameStateClusterer.to_features(item) for item in x], dtype=np.float32)
+    labels = DBSCAN(eps=1e-2, min_samples=1, metric="euclidean").fit_predict(features)
+
+    centers = list()
+    for cluster_id in sorted(set(labels) - {-1}):
+        cluster_indices = np.where(labels == cluster_id)[0]
+        cluster_features = features[cluster_indices]
+        distances = np.linalg.norm(cluster_features - cluster_features.mean(axis=0), axis=1)
+        centers.append(x[cluster_indices[np.argmin(distances)]])
+    return centers
+
+
+def test_collapse_duplicates_round_trip():
+    rng = np.random.default_rng(0)
+    features = rng.integers(0, 3, size=(1000, 4)).astype(np.float32)
+
+    unique, first_indices, inverse, counts = DatasetClusterer.collapse_duplicates(features)
+
+    assert np.array_equal(unique[inverse], features)
+    assert np.array_equal(features[first_indices], unique)
+    assert np.all(np.diff(first_indices) > 0)
+    assert counts.sum() == len(features)
+    for row, first_idx in zip(unique, first_indices):
+        assert np.flatnonzero((features == row).all(axis=1))[0] == first_idx
+
+
+def test_transform_matches_clustering_every_row():
+    # Most states appear several times, like perturbations that did not change any feature
+    states = synthetic_states(400, seed=2)
+    r = random.Random(3)
+    x = GamePalsDataset([r.choice(states) for _ in range(3000)])
+
+    centers = list(DoomGameStateClusterer().transform(x))
+
+    assert centers == reference_centers(x)
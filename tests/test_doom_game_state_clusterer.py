@@ -0,0 +1,25 @@
+import numpy as np
+
+from doom.preprocessing.doom_game_state_clusterer import DoomGameStateClusterer
+from doom.utils.doom_game_state import DoomGameState
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
+from tests.synthetic import synthetic_states
+
+
+def test_to_features_batch_matches_to_features():
+    states = synthetic_states(2000)
+    expected = np.stack([DoomGameStateClusterer.to_features(state) for state in states])
+
+    assert np.array_equal(DoomGameStateClusterer.to_features_batch(states), expected)
+    assert np.array_equal(DoomGameStateClusterer.to_features_batch(DoomGameStateBatch.from_dataset(states)), expected)
+
+
+def test_to_features_batch_on_projected_batch(tmp_path):
+    states = synthetic_states(500, seed=1)
+    DoomGameStateBatch.from_dataset(states).save(str(tmp_path / "states"))
+    projected = DoomGameStateBatch.load(
+        str(tmp_path / "states"), DoomGameState, fields=DoomGameStateClusterer.FEATURE_FIELDS
+    )
+    expected = np.stack([DoomGameStateClusterer.to_features(state) for state in states])
+
+    assert np.array_equal(DoomGameStateClusterer.to_features_batch(projected), expected)
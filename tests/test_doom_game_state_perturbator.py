@@ -0,0 +1,33 @@
+import numpy as np
+
+from core.datasets import GamePalsDataset
+from doom.preprocessing.doom_game_state_perturbator import DoomGameStatePerturbator
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
+from tests.synthetic import synthetic_states
+
+
+def dumps(states) -> list[dict]:
+    return [state.model_dump() for state in states]
+
+
+def test_perturbate_batch_matches_item_mode():
+    states = synthetic_states(300, seed=5)
+    perturbator = DoomGameStatePerturbator(seed=11)
+
+    expected = dumps(perturbator.transform(GamePalsDataset(states)))
+    assert dumps(perturbator.transform(DoomGameStateBatch.from_dataset(states)).to_items()) == expected
+    assert dumps(perturbator.augment(GamePalsDataset(states))) == expected
+
+
+def test_perturbate_batch_is_slice_reproducible():
+    states = synthetic_states(300, seed=5)
+    perturbator = DoomGameStatePerturbator(seed=11)
+    batch = DoomGameStateBatch.from_dataset(states)
+
+    # The perturbations of an item depend on its index in the transformed batch only
+    sliced = perturbator.transform(batch.take(np.arange(100, 200))).to_items()
+    assert dumps(sliced) == dumps(
+        perturbation
+        for index, state in enumerate(states[100:200])
+        for perturbation in perturbator.perturbations_of(state, index)
+    )
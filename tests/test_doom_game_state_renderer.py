@@ -0,0 +1,36 @@
+from doom.utils.doom_game_state import DoomGameState
+from doom.utils.doom_game_state_batch import DoomGameStateBatch
+from doom.utils.doom_game_state_renderer import DoomGameStateRenderer
+from tests.synthetic import synthetic_states
+
+
+def reference_prompt(state: DoomGameState) -> str:
+    """The rendering of a game state through its pruned model_dump and toonify."""
+    d = state.model_dump()
+    del d['GROUND_CHECK']
+    del d['AIMED_AT']['horizontalAngle']
+    del d['AIMED_AT']['verticalAngle']
+    for m in d['MONSTERS']:
+        del m['monsterMass']
+        del m['inFOV']
+        del m['screenX']
+        del m['screenY']
+    d['INVENTORY']['inventorySlots'] = [w for w in d['INVENTORY']['inventorySlots'] if w['canUse']]
+    for w in d['INVENTORY']['inventorySlots']:
+        del w['canUse']
+    return DoomGameState.toonify(d)
+
+
+def test_to_prompt_ready_matches_reference():
+    states = synthetic_states(2000)
+
+    assert [state.to_prompt_ready() for state in states] == [reference_prompt(state) for state in states]
+
+
+def test_render_batch_matches_to_prompt_ready():
+    states = synthetic_states(2000, seed=1)
+    expected = [state.to_prompt_ready() for state in states]
+
+    assert DoomGameStateRenderer.render_batch(DoomGameStateBatch.from_dataset(states)) == expected
+    assert DoomGameStateRenderer.render_many(states) == expected
+    assert DoomGameStateRenderer(n_workers=2, chunk_size=256).render_parallel(states) == expected
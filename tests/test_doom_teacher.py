@@ -0,0 +1,70 @@
+import json
+import random
+
+from core.datasets import GamePalsDataset
+from core.knowledge.user_command_batch import UserCommandBatch
+from core.utils.fake_openai import FakeOpenAI
+from doom.kd.doom_teacher import DoomTeacher, DoomTeacherOptions
+from tests.synthetic import synthetic_states
+
+PROMPT = "Generate commands for <GAME_NAME>"
+
+
+def teacher_on(tmp_path, n_states: int, respond, failure_rate: float) -> DoomTeacher:
+    options = DoomTeacherOptions(
+        prompt_data_filepath="prompts/doom-prompt-data.json",
+        open_ai_model="gpt-5.1",
+        user_commands_batch_input_filepath=str(tmp_path / "in.jsonl"),
+        user_commands_batch_output_filepath=str(tmp_path / "out"),
+        max_tokens_per_batch=200_000,
+        max_batch_retries=1,
+        min_poll_interval=0.0,
+        max_poll_interval=0.0,
+    )
+    client = FakeOpenAI(respond=respond, failure_rate=failure_rate, seed=0)
+    return DoomTeacher(GamePalsDataset(synthetic_states(n_states, seed=3)), options, client=client)
+
+
+def flaky_respond(seed: int = 0):
+    """An answer with one user command per request, or an action for labeling requests, invalid 10% of the time."""
+    r = random.Random(seed)
+
+    def respond(body: dict) -> str:
+        content = body["input"][-1]["content"]
+        invalid = r.random() < 0.1
+        if "USER COMMAND:" in content:
+            return "" if invalid else "ACTION"
+        if invalid:
+            return "not json"
+        return json.dumps({
+            "command": f"command {len(content)}", "intent": "x",
+            "explicitness": 0.5, "atomicity": 0.5, "contextuality": 0.5,
+        })
+
+    return respond
+
+
+def test_unanswered_requests_are_listed_for_retry(tmp_path):
+    teacher = teacher_on(tmp_path, 300, flaky_respond(), failure_rate=0.1)
+    teacher.generate_user_commands(PROMPT)
+
+    with open(tmp_path / "out.retry.json", encoding="utf-8") as f:
+        retry_ids = json.load(f)
+    answered = set(teacher.user_commands.columns["game_state_idx"].tolist())
+    missing = {f"state-{idx}" for idx in teacher.unique_state_indices()} - {f"state-{idx}" for idx in answered}
+    assert missing
+    assert set(retry_ids) == missing
+
+
+def test_unlabeled_commands_are_listed_for_retry(tmp_path):
+    teacher = teacher_on(tmp_path, 300, flaky_respond(), failure_rate=0.1)
+    teacher.generate_user_commands(PROMPT)
+    teacher.generate_labels("Label for <GAME_NAME>")
+
+    with open(tmp_path / "out.labels.jsonl.retry.json", encoding="utf-8") as f:
+        retry_ids = json.load(f)
+    # Labeling requests are indexed by the position of their command in the grouped order
+    _, _, order = UserCommandBatch.load(str(tmp_path / "out")).group_by_state()
+    missing = {f"label-{position}" for position, idx in enumerate(order) if teacher.labels[idx] is None}
+    assert missing
+    assert set(retry_ids) == missing